@@ -0,0 +1,50 @@
+'''
+多个worker进程用claim()并行处理任务的吞吐量，检查是否随进程数线性增长
+数据库由环境变量EQUIPSEDIT_DB指定，运行：python benchmarks/claim.py [任务数] [每批条数]
+'''
+
+import sys
+import time
+import multiprocessing
+
+from equipsedit import models, fields, sql_db
+
+class BenchJob(models.Model):
+    _name = 'bench.job'
+    _description = '任务测试'
+    _claim_field = 'state'
+
+    state = fields.Selection([('pending', '待处理'), ('claimed', '处理中'), ('done', '完成')],
+                             default='pending', index=True)
+
+def init_worker():
+    # fork出的子进程继承了父进程的数据库连接，多个进程共用一个连接会互相干扰，每个进程单独连接
+    models.Connector = sql_db.connect(models.DB_URL)
+
+def worker(batch):
+    model = BenchJob()
+    count = 0
+    while True:
+        rows = list(model.claim(limit=batch))
+        if not rows:
+            return count
+        # 模拟每条任务1毫秒的处理时间
+        time.sleep(0.001 * len(rows))
+        model.mark_done([row['id'] for row in rows])
+        count += len(rows)
+
+def main(jobs=2000, batch=20):
+    model = BenchJob()
+    model.create_table()
+    for processes in (1, 2, 4, 8):
+        model._db.execute(f'DELETE FROM {model._get_name()}')
+        model.upsert_multi({'state': 'pending'} for _ in range(jobs))
+
+        start = time.perf_counter()
+        with multiprocessing.Pool(processes, init_worker) as pool:
+            counts = pool.map(worker, [batch] * processes)
+        seconds = time.perf_counter() - start
+        print(f'{processes}个进程：处理{sum(counts)}条，{sum(counts) / seconds:.0f}条/秒')
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,67 @@
+'''
+乐观锁与悲观锁（SELECT ... FOR UPDATE）在同一行高并发修改下的吞吐量对比
+数据库由环境变量EQUIPSEDIT_DB指定，运行：python benchmarks/locking.py [进程数] [秒数]
+'''
+
+import sys
+import time
+import multiprocessing
+
+from equipsedit import models, fields, sql_db
+from equipsedit.models import retry_on_conflict
+from equipsedit.errors import ConcurrencyError
+
+class BenchEquip(models.Model):
+    _name = 'bench.equip'
+    _description = '锁测试装备'
+    _version_field = 'version'
+
+    value = fields.Int(default=1, null=False)
+    version = fields.Int(default=1, null=False)
+
+def optimistic(model, id):
+    def job():
+        row = list(model.search(id=id))[0]
+        return model.update(id, {'value': row['value'] + 1}, version=row['version'])
+
+    retry_on_conflict(job, retries=100, delay=0.001)
+
+def pessimistic(model, id):
+    table = model._get_name()
+    db = model._db
+    with db.transaction():
+        db.execute(f'SELECT value FROM {table} WHERE id=%s {db.dialect.for_update_sql()}', (id,))
+        value = db.cursor.fetchone()['value']
+        db.execute(f'UPDATE {table} SET value=%s, version=version+1 WHERE id=%s', (value + 1, id))
+
+def init_worker():
+    # fork出的子进程继承了父进程的数据库连接，多个进程共用一个连接会互相干扰，每个进程单独连接
+    models.Connector = sql_db.connect(models.DB_URL)
+
+def worker(args):
+    mode, id, seconds = args
+    model = BenchEquip()
+    func = optimistic if mode == 'optimistic' else pessimistic
+    count = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        try:
+            func(model, id)
+            count += 1
+        except ConcurrencyError:
+            pass
+
+    return count
+
+def main(processes=4, seconds=5):
+    model = BenchEquip()
+    model.create_table()
+    id = model.create({'value': 1})
+
+    for mode in ('optimistic', 'pessimistic'):
+        with multiprocessing.Pool(processes, init_worker) as pool:
+            counts = pool.map(worker, [(mode, id, seconds)] * processes)
+        print(f'{mode}：{processes}个进程，{sum(counts) / seconds:.0f}次/秒')
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,37 @@
+'''
+一次保存包含10条语句时，逐条执行与批量语句一次发送的耗时对比
+需要可连接的MySQL，运行：python benchmarks/pipeline.py [保存次数]
+'''
+
+import sys
+import time
+
+from equipsedit.models import Connector
+from equipsedit.apps.users.users import UserCate
+
+def save(model, ids, pipeline=None):
+    for i, id in enumerate(ids):
+        model.update(id, {'name': f'标签{i}'}, pipeline=pipeline)
+
+def main(rounds=200):
+    model = UserCate()
+    model.create_table()
+    ids = [model.create({'name': f'标签{i}'}) for i in range(10)]
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        with Connector.transaction():
+            save(model, ids)
+    sequential = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        with Connector.pipeline() as p:
+            save(model, ids, p)
+    pipelined = (time.perf_counter() - start) / rounds
+
+    print(f'逐条执行：{sequential * 1000:.2f}毫秒/次，批量语句：{pipelined * 1000:.2f}毫秒/次')
+    model.delete(ids)
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
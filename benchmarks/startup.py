@@ -0,0 +1,98 @@
+'''
+大量模型时的启动耗时：生成包含多个模型模块的临时包，在子进程中分别测量
+    全部导入  导入所有模块，逐个模型检查并建表（原启动方式）
+    冷启动    没有缓存，扫描模块源码、生成编译缓存
+    热启动    读取清单和编译缓存，只导入用到的模块
+每次启动都建表（表已存在时跳过）并查询其中一个模型
+默认使用临时SQLite数据库，可通过环境变量EQUIPSEDIT_DB指定
+运行：python benchmarks/startup.py [模块数] [每个模块的模型数]
+'''
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import statistics
+
+PACKAGE = 'bench_startup_apps'
+
+_EAGER = f'''
+import importlib, pkgutil
+from equipsedit import models
+import {PACKAGE}
+for info in pkgutil.walk_packages({PACKAGE}.__path__, '{PACKAGE}.'):
+    importlib.import_module(info.name)
+for cls in models.Model.__subclasses__():
+    cls().create_table()
+list(cls().search(id=1))
+'''
+
+_LAZY = f'''
+from equipsedit import loader
+loader.create_tables()
+list(loader.get('{PACKAGE}.m0.model0')().search(id=1))
+'''
+
+_FIELDS = '''
+    name = fields.Char(string='名称', index=True)
+    code = fields.Char(length=32, unique=True)
+    state = fields.Selection([('draft', '草稿'), ('open', '进行中'), ('done', '完成')], default='draft')
+    amount = fields.Float('金额')
+    count = fields.Int('数量')
+    day = fields.Date('日期')
+    note = fields.Text('备注')
+'''
+
+def generate(root, modules, models):
+    '''
+    生成modules个模块，每个模块models个模型
+    '''
+    package = os.path.join(root, PACKAGE)
+    os.makedirs(package)
+    open(os.path.join(package, '__init__.py'), 'w').close()
+    for m in range(modules):
+        with open(os.path.join(package, f'm{m}.py'), 'w', encoding='utf-8') as f:
+            f.write('from equipsedit import models, fields\n')
+            for i in range(models):
+                f.write(f'\nclass Model{i}(models.Model):\n'
+                        f"    _name = '{PACKAGE}.m{m}.model{i}'\n"
+                        f'    _init = True\n'
+                        f'{_FIELDS}')
+
+def run(code, env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def main(modules=50, models=10, repeat=3):
+    root = tempfile.mkdtemp(prefix='equipsedit_startup_')
+    cache_dir = os.path.join(root, 'cache')
+    try:
+        generate(root, modules, models)
+        env = dict(os.environ,
+                   PYTHONPATH=os.pathsep.join([root, os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                               os.environ.get('PYTHONPATH', '')]),
+                   EQUIPSEDIT_APPS=PACKAGE,
+                   EQUIPSEDIT_MODEL_CACHE=cache_dir)
+        env.setdefault('EQUIPSEDIT_DB', f'sqlite:///{os.path.join(root, "startup.db")}')
+
+        print(f'{modules}个模块，{modules * models}个模型')
+        # 先建好所有表，之后只测量启动本身
+        run(_LAZY, env)
+
+        results = {'全部导入': [], '冷启动': [], '热启动': []}
+        for _ in range(repeat):
+            results['全部导入'].append(run(_EAGER, env))
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            results['冷启动'].append(run(_LAZY, env))
+            results['热启动'].append(run(_LAZY, env))
+
+        for name, seconds in results.items():
+            print(f'{name}：{statistics.median(seconds) * 1000:.0f}毫秒')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
@@ -1,8 +1,18 @@
+from . import dialects
 from . import sql_db
 from . import models
 from . import fields
 from . import errors
-from . import apps
+from . import columns
+from . import transfer
+from . import cache
+from . import snapshot
+from . import changes
+from . import compute
+from . import partition
+from . import shard
+from . import advisor
+from . import loader
 
 import sys
 import os
@@ -0,0 +1,246 @@
+'''
+列类型建议：抽样统计各列实际数据的宽度和取值范围，给出更窄的类型及预计节省的字节数；
+抽样只用于估算，有建议的列再统计全表的最大宽度、取值范围和不在选项中的值，按全表结果给出修改语句
+
+字节数按InnoDB行格式、UTF8MB4字符集估算：
+    CHAR(n)     每行至少n字节
+    VARCHAR(n)  实际字节数加1~2字节长度前缀；内存临时表和排序缓冲区仍按n*4字节分配
+    整数        TINYINT/SMALLINT/MEDIUMINT/INT/BIGINT分别为1/2/3/4/8字节
+'''
+
+import re
+import copy
+import math
+
+from equipsedit import fields
+
+# 抽样行数
+SAMPLE = 10000
+# 建议的宽度相对抽样最大值的余量
+HEADROOM = 1.25
+
+INT_BYTES = {'TINYINT': 1, 'SMALLINT': 2, 'MEDIUMINT': 3, 'INT': 4, 'BIGINT': 8}
+_CHAR_TYPES = ('CHAR', 'VARCHAR')
+
+def _parse_type(value):
+    '''
+    解析数据库中的列类型，如'varchar(32)'、'int(11) unsigned'
+    :return: (类型, 长度)
+    '''
+    match = re.match(r'\s*(\w+)\s*(?:\((\d+)\))?', value or '')
+    if not match:
+        return '', 0
+    return match.group(1).upper(), int(match.group(2) or 0)
+
+def _width(length, current):
+    '''
+    建议的字符宽度：抽样最大长度加余量后取不小于8的2的幂，不超过当前宽度
+    '''
+    width = max(8, 2 ** math.ceil(math.log2(max(length * HEADROOM, 1))))
+    return min(width, current) if current else width
+
+def _prefix(width):
+    return 1 if width * 4 <= 255 else 2
+
+def _char_bytes(_type, length, avg_bytes):
+    '''
+    文字列每行平均占用字节数
+    '''
+    if _type == 'CHAR':
+        return max(length, avg_bytes) + 1
+    return avg_bytes + _prefix(length)
+
+def _stored_bytes(field, _type, length, avg_bytes):
+    if _type in INT_BYTES:
+        return INT_BYTES[_type]
+    if _type == 'ENUM':
+        return 1 if len(field.selects) <= 255 else 2
+    return _char_bytes(_type, length, avg_bytes)
+
+def _candidates(model):
+    '''
+    可能收窄的字段：Char、Selection和普通Int，主键、外键、自增字段的类型需与引用方一致，不参与
+    '''
+    for field in model._column_fields():
+        if field.primary_key or field.auto_increment or field.is_m2o_key:
+            continue
+        if isinstance(field, (fields.Char, fields.Selection)) or type(field) is fields.Int:
+            yield field
+
+def _sample(connector, model, _fields, sample):
+    '''
+    一条语句抽样统计各列：文字列的最大字符数、平均字节数，整数列的最小值和最大值
+    '''
+    dialect = connector.dialect
+    items = ['COUNT(*) AS sampled']
+    for field in _fields:
+        name = field.name
+        if type(field) is fields.Int:
+            items += [f'MIN({name}) AS {name}__min', f'MAX({name}) AS {name}__max']
+        else:
+            items += [f'MAX({dialect.char_length_sql(name)}) AS {name}__max_length',
+                      f'AVG({dialect.byte_length_sql(name)}) AS {name}__avg_bytes']
+    names = ','.join(field.name for field in _fields)
+    connector.execute(f'SELECT {",".join(items)} FROM '
+                      f'(SELECT {names} FROM {model._get_name()} {dialect.limit_sql(sample)}) s')
+    return connector.cursor.fetchone()
+
+def _scan(connector, model, _fields):
+    '''
+    一条语句统计有建议的列在全表中的最大字符数、最小值和最大值、不在选项中的值的行数
+    '''
+    dialect = connector.dialect
+    items = []
+    for field in _fields:
+        name = field.name
+        if type(field) is fields.Int:
+            items += [f'MIN({name}) AS {name}__min', f'MAX({name}) AS {name}__max']
+        elif isinstance(field, fields.Selection):
+            keys = ','.join(str(key) if isinstance(key, int) else dialect.quote(key) for key in field.selects)
+            items.append(f'SUM(CASE WHEN {name} IS NOT NULL AND {name} NOT IN ({keys}) THEN 1 ELSE 0 END) '
+                         f'AS {name}__invalid')
+        else:
+            items.append(f'MAX({dialect.char_length_sql(name)}) AS {name}__max_length')
+    connector.execute(f'SELECT {",".join(items)} FROM {model._get_name()}')
+    return connector.cursor.fetchone()
+
+def _column_stats(stats, field):
+    prefix = f'{field.name}__'
+    return {k[len(prefix):]: v for k, v in stats.items() if k.startswith(prefix)}
+
+def _column_sql(field, dialect, **kw):
+    '''
+    按建议修改后的字段定义
+    '''
+    field = copy.copy(field)
+    for k, v in kw.items():
+        setattr(field, k, v)
+    return field.get_sql(dialect)[:-1].strip()
+
+def _suggest(field, current, stats, dialect, table):
+    '''
+    :param str current: 数据库中的列类型
+    :param dict stats: 该列的抽样结果
+    :return: 建议，无需修改时返回None
+    '''
+    _type, length = _parse_type(current)
+    max_length = int(stats['max_length'] or 0) if 'max_length' in stats else None
+    avg_bytes = float(stats.get('avg_bytes') or 0)
+    # 列中不在选项中的值的行数，迁移会截断这些值，需先清理数据
+    invalid = int(stats.get('invalid') or 0)
+    temp_bytes = 0
+    sqls = []
+
+    if isinstance(field, fields.Selection):
+        # 列仍是旧的CHAR或INT类型时，迁移到字段定义的类型
+        proposed = dialect.field_type_sql(field).strip()
+        if _parse_type(proposed) == (_type, length) or field._type in _CHAR_TYPES or \
+                _type not in (_CHAR_TYPES if field.codec or field._type == 'ENUM' else INT_BYTES):
+            return None
+        if field.codec:
+            cases = ' '.join(f'WHEN {dialect.quote(key)} THEN {dialect.quote(code)}'
+                             for code, key in enumerate(field.codec))
+            sqls.append(f'UPDATE {table} SET {field.name}=CASE {field.name} {cases} ELSE {field.name} END')
+        after = _stored_bytes(field, field._type, field.length, avg_bytes)
+        sqls.append(dialect.modify_column_sql(table, field.get_sql(dialect)[:-1].strip()))
+
+    elif isinstance(field, fields.Char):
+        if _type not in _CHAR_TYPES:
+            return None
+        width = _width(max_length or 0, length)
+        if _type == 'VARCHAR' and width >= length:
+            return None
+        proposed = f'VARCHAR({width})'
+        after = _char_bytes('VARCHAR', width, avg_bytes)
+        temp_bytes = (length - width) * 4
+        sqls.append(dialect.modify_column_sql(table, _column_sql(field, dialect, _type='VARCHAR', length=width)))
+
+    else:
+        if _type not in INT_BYTES or stats['min'] is None:
+            return None
+        low, high = int(stats['min']), int(stats['max'])
+        # 取值范围留出一倍余量
+        proposed = fields.int_type(min(low, 0) * 2, max(high, 0) * 2)
+        if INT_BYTES[proposed] >= INT_BYTES[_type]:
+            return None
+        after = INT_BYTES[proposed]
+        sqls.append(dialect.modify_column_sql(table, _column_sql(field, dialect, _type=proposed)))
+
+    before = _stored_bytes(field, _type, length, avg_bytes)
+    return {
+        'field': field.name,
+        'current': current,
+        'proposed': proposed,
+        'max_length': max_length,
+        'bytes_per_row': max(before - after, 0),
+        'temp_bytes_per_row': temp_bytes,
+        'invalid': invalid,
+        # 有不在选项中的值时不给出语句；SQLite不支持修改列类型，modify_column_sql返回空字符串
+        'sql': sqls if not invalid and all(sqls) else [],
+    }
+
+def advise(model, connector, sample=SAMPLE):
+    '''
+    抽样统计模型表中各列的实际数据，给出更窄的列类型；
+    有建议的列再扫描全表，按全表的最大宽度和取值范围重新给出建议和修改语句，每行节省字节数仍为抽样估算
+    :param model: 模型
+    :param connector: 数据库连接器
+    :param int sample: 抽样行数
+    :return: {'table': 表名, 'rows': 表行数, 'sampled': 抽样行数, 'suggestions': 建议列表,
+              'bytes_saved': 按表行数估算的总节省字节数}
+              建议包含field、current（当前类型）、proposed（建议类型）、max_length（全表最大字符数）、
+              bytes_per_row（每行节省字节数）、temp_bytes_per_row（内存临时表每行节省字节数）、bytes_saved、
+              invalid（Selection列中不在选项中的值的行数）、
+              sql（修改语句，需确认后自行执行；invalid不为0或数据库不支持时为空）
+    '''
+    dialect = connector.dialect
+    table = model._get_name()
+
+    connector.execute(dialect.columns_sql(), (table,))
+    current = {row['name']: row['type'] for row in connector.cursor.fetchall()}
+    connector.execute(dialect.table_rows_sql(table))
+    rows = int(connector.cursor.fetchone()['count'] or 0)
+
+    _fields = [field for field in _candidates(model) if field.name in current]
+    ret = {'table': table, 'rows': rows, 'sampled': 0, 'suggestions': [], 'bytes_saved': 0}
+    if not _fields:
+        return ret
+
+    stats = _sample(connector, model, _fields, sample)
+    ret['sampled'] = stats['sampled']
+    if not stats['sampled']:
+        return ret
+
+    # 先按抽样筛选可能收窄的列，再按这些列的全表统计给出建议
+    _fields = [field for field in _fields
+               if _suggest(field, current[field.name], _column_stats(stats, field), dialect, table)]
+    if not _fields:
+        return ret
+    full = _scan(connector, model, _fields)
+
+    for field in _fields:
+        column = dict(_column_stats(stats, field), **_column_stats(full, field))
+        suggestion = _suggest(field, current[field.name], column, dialect, table)
+        if suggestion:
+            suggestion['bytes_saved'] = int(suggestion['bytes_per_row'] * rows)
+            ret['suggestions'].append(suggestion)
+
+    ret['bytes_saved'] = sum(s['bytes_saved'] for s in ret['suggestions'])
+    return ret
+
+def report(results):
+    '''
+    将advise()的结果整理为文本
+    :param list results: advise()的返回值列表
+    '''
+    lines = []
+    for result in results:
+        lines.append(f'{result["table"]}：{result["rows"]}行，抽样{result["sampled"]}行，'
+                     f'预计节省{result["bytes_saved"] / 1024 / 1024:.2f}MB')
+        for s in result['suggestions']:
+            width = '' if s['max_length'] is None else f'最长{s["max_length"]}，'
+            invalid = f'，{s["invalid"]}行不在选项中，需先清理' if s['invalid'] else ''
+            lines.append(f'    {s["field"]}: {s["current"]} -> {s["proposed"]}，'
+                         f'{width}每行节省{s["bytes_per_row"]:.1f}字节{invalid}')
+            lines.extend(f'        {sql};' for sql in s['sql'])
+    return '\n'.join(lines)
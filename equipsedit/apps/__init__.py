@@ -1,2 +1,13 @@
-from . import users
-from . import base
+'''
+应用模块，不在导入包时全部导入，由equipsedit.loader在首次使用模型时导入
+'''
+
+import importlib
+
+def __getattr__(name):
+    try:
+        return importlib.import_module(f'{__name__}.{name}')
+    except ModuleNotFoundError as e:
+        if e.name != f'{__name__}.{name}':
+            raise
+        raise AttributeError(name)
@@ -4,6 +4,7 @@ class IrModel(models.Model):
     _name = "ir.model"
     _description = 'Model'
     _init = True
+    _cache = True
 
     name = fields.Char(string="模型名称")
     model = fields.Char(string="模型")
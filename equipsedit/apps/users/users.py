@@ -4,6 +4,7 @@ class UserCate(models.Model):
     _name = 'user.cate'
     _description = '用户标签'
     _init = True
+    _cache = True
 
     name = fields.Char(string='标签名')
 
@@ -14,11 +15,11 @@ class Users(models.Model):
 
     account = fields.Int(unique=True, null=False, string="账号")
     password = fields.Char(null=False, string="密码")
-    name = fields.Char(null=False, string="用户名")
+    name = fields.Char(null=False, string="用户名", fulltext=True)
     profession = fields.Char(null=False)
     source = fields.Float('分数')
     brithday = fields.Date('生日')
-    comment = fields.Text('个性签名')
+    comment = fields.Text('个性签名', fulltext=True)
     # parent_id = fields.Many2one('self', string="父母")
     cates = fields.Many2one(UserCate, string="标签")
     # cates = fields.Many2many(UserCate, 'user_cate_rel', 'user_id', 'cate_id', string="标签")
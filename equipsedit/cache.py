@@ -0,0 +1,180 @@
+'''
+跨进程的查询结果缓存，以文件保存，写表时更新表版本号使缓存失效
+'''
+
+import os
+import stat
+import time
+import uuid
+import pickle
+import getpass
+import hashlib
+import tempfile
+
+_MISS = object()
+
+def private_dir(path):
+    '''
+    创建只允许当前用户访问的目录（0700）；目录已存在时检查属于当前用户且其他用户不可写，
+    否则其他用户可以放入会被读取执行的缓存文件，抛出PermissionError
+    '''
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f'缓存目录{path}不是目录')
+    if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o022):
+        raise PermissionError(f'缓存目录{path}不属于当前用户或其他用户可写')
+    return path
+
+class ResultCache(object):
+    '''
+    基于文件的查询结果缓存，同一目录可被多个进程共享
+
+    缓存条目以pickle保存，读取时会执行其中的代码，因此缓存目录只允许当前用户写入：
+    默认目录按用户区分并以0700权限创建，目录不属于当前用户或其他用户可写时拒绝使用
+
+    缓存键由数据库、SQL、参数和所涉及表的版本号组成，写表时更新版本号，旧的缓存即无法命中，
+    之后由过期时间或LRU淘汰清理；不同数据库（如各个分片）中的同名表分别计算版本号和缓存键
+
+    :param str path: 缓存目录，默认为临时目录下的equipsedit_cache_用户名
+    :param int ttl: 缓存过期秒数
+    :param int max_entries: 最多缓存条数，超过时淘汰最久未访问的缓存
+    '''
+    def __init__(self, path=None, ttl=60, max_entries=1000):
+        self.path = path or os.path.join(tempfile.gettempdir(), f'equipsedit_cache_{getpass.getuser()}')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {}
+        # 估算的缓存条数，超过max_entries时才扫描目录，为None时下次写入即扫描
+        self._count = None
+
+        for path in (self.path, os.path.join(self.path, 'versions'), os.path.join(self.path, 'entries')):
+            private_dir(path)
+
+    def _version_file(self, table, db=''):
+        if db:
+            table = f'{table}.{hashlib.sha1(db.encode()).hexdigest()[:16]}'
+        return os.path.join(self.path, 'versions', table)
+
+    def _entry_file(self, key):
+        return os.path.join(self.path, 'entries', key)
+
+    def _write(self, path, data):
+        '''
+        先写临时文件再替换，避免其他进程读到写了一半的文件
+        '''
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def version(self, table, db=''):
+        '''
+        获取表的版本号
+        :param str db: 表所在的数据库标识，见Connector.name
+        '''
+        try:
+            with open(self._version_file(table, db), 'rb') as f:
+                return f.read().decode()
+        except FileNotFoundError:
+            return ''
+
+    def bump(self, table, db=''):
+        '''
+        更新表的版本号，使该表的缓存全部失效
+        版本号为随机值，多个进程同时更新也不会得到相同的版本号
+        '''
+        self._write(self._version_file(table, db), uuid.uuid4().hex.encode())
+
+    def key(self, table, sql, args=None, db=''):
+        data = f'{db}\0{table}\0{self.version(table, db)}\0{sql}\0{args!r}'
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def get(self, key):
+        path = self._entry_file(key)
+        try:
+            with open(path, 'rb') as f:
+                expire, value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return _MISS
+
+        if expire < time.time():
+            self._remove(path)
+            return _MISS
+
+        # 更新访问时间，用于LRU淘汰
+        os.utime(path)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self._write(self._entry_file(key), pickle.dumps((time.time() + (ttl or self.ttl), value)))
+        self._evict()
+
+    def fetch(self, name, table, sql, args, func, ttl=None, db=''):
+        '''
+        读取缓存，未命中时执行func并写入缓存
+        :param str name: 统计命中率的名称（模型名）
+        :param str table: 查询的表
+        :param str sql: 查询语句
+        :param args: 查询参数
+        :param func: 未命中时获取结果的函数
+        :param int ttl: 过期秒数，为空时使用默认值
+        :param str db: 表所在的数据库标识，见Connector.name
+        '''
+        stats = self.stats.setdefault(name, [0, 0])
+        key = self.key(table, sql, args, db)
+        value = self.get(key)
+        if value is not _MISS:
+            stats[0] += 1
+            return value
+
+        stats[1] += 1
+        value = func()
+        self.set(key, value, ttl)
+        return value
+
+    def hit_ratio(self, name=None):
+        '''
+        当前进程的缓存命中率
+        :param str name: 模型名，为空时统计所有模型
+        '''
+        stats = [self.stats.get(name, [0, 0])] if name else self.stats.values()
+        hits = sum(s[0] for s in stats)
+        total = hits + sum(s[1] for s in stats)
+        return hits / total if total else 0.0
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        '''
+        写入后调用：按本进程写入的条数累加估算的缓存条数，超过max_entries时才扫描目录，
+        淘汰到max_entries的90%，留出余量避免接下来每次写入都扫描
+        '''
+        if self._count is not None:
+            self._count += 1
+            if self._count <= self.max_entries:
+                return
+
+        entries = []
+        with os.scandir(os.path.join(self.path, 'entries')) as it:
+            for entry in it:
+                if not entry.name.endswith('.tmp'):
+                    entries.append(entry)
+
+        self._count = len(entries)
+        if len(entries) <= self.max_entries:
+            return
+
+        keep = int(self.max_entries * 0.9)
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - keep]:
+            self._remove(entry.path)
+        self._count = keep
+
+    def clear(self):
+        for entry in os.scandir(os.path.join(self.path, 'entries')):
+            self._remove(entry.path)
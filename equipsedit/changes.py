@@ -0,0 +1,218 @@
+'''
+ORM写入的变更通知：模型写表后发布变更事件，由订阅者或日志文件接收，
+下游缓存、副本只需刷新受影响的记录
+'''
+
+import os
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+
+OPS = ('create', 'update', 'delete', 'upsert', 'import')
+
+class Change(object):
+    '''
+    一次写入的变更事件
+
+    :param str model: 模型名
+    :param str op: 操作，见OPS
+    :param list ids: 受影响的记录ID，新插入的自增ID按写入前的最大ID查询，可能包含同时写入的其他记录
+    :param list fields: 写入的字段，delete时为空
+    :param datetime write_time: 写入时间
+    '''
+    __slots__ = ('model', 'op', 'ids', 'fields', 'write_time')
+
+    def __init__(self, model, op, ids=None, fields=None, write_time=None):
+        self.model = model
+        self.op = op
+        self.ids = ids
+        self.fields = fields or []
+        self.write_time = write_time or datetime.now()
+
+    def __repr__(self):
+        return f'<Change {self.model} {self.op} {self.ids}>'
+
+    def to_dict(self):
+        return {'model': self.model, 'op': self.op, 'ids': self.ids, 'fields': self.fields,
+                'write_time': self.write_time.isoformat(' ')}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['model'], data['op'], data['ids'], data['fields'],
+                   datetime.fromisoformat(data['write_time']))
+
+class SubscriberSink(object):
+    '''
+    进程内订阅者：事件放入有界队列，由后台线程按批调用callback(changes)
+
+    队列满时写入方等待，形成反压；指定timeout时最多等待timeout秒，超时的事件被丢弃并计入dropped
+    :param callback: 回调函数，参数为Change列表
+    :param int batch_size: 每批最多事件数
+    :param int max_pending: 队列中最多未处理的事件数
+    :param float timeout: 队列满时最多等待秒数，为空时一直等待
+    '''
+    _STOP = object()
+
+    def __init__(self, callback, batch_size=100, max_pending=10000, timeout=None):
+        self.callback = callback
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.delivered = 0
+        self.dropped = 0
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def emit(self, change):
+        try:
+            self._queue.put(change, timeout=self.timeout)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is self._STOP
+            changes = batch[:-1] if stop else batch
+            try:
+                if changes:
+                    self.callback(changes)
+                    self.delivered += len(changes)
+            except Exception as e:
+                print(f'变更订阅处理失败：{e!r}')
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        '''
+        等待队列中的事件处理完
+        '''
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+class LogFileSink(object):
+    '''
+    追加写入的本地日志文件，每行一个JSON事件
+    事件先写入缓冲区，满batch_size条或距上次写入超过flush_interval秒时写入文件；
+    写文件在写入方的线程中进行，磁盘跟不上时写入方随之变慢；
+    后台线程每flush_interval秒写入一次缓冲区，写入停止后最后一批事件也不会一直留在缓冲区中
+
+    :param str path: 日志文件路径
+    :param int batch_size: 每批写入事件数
+    :param float flush_interval: 最长缓冲秒数
+    :param bool fsync: 每批写入后是否同步到磁盘
+    '''
+    def __init__(self, path, batch_size=100, flush_interval=1.0, fsync=False):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._run, daemon=True)
+        self._timer.start()
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def emit(self, change):
+        with self._lock:
+            self._buffer.append(json.dumps(change.to_dict(), ensure_ascii=False) + '\n')
+            if len(self._buffer) >= self.batch_size or \
+                    time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._file.writelines(self._buffer)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self._closed.set()
+        self._timer.join()
+        with self._lock:
+            self._flush()
+            self._file.close()
+
+def read_log(path, since=None):
+    '''
+    读取LogFileSink写入的日志
+    :param str path: 日志文件路径
+    :param datetime since: 只返回write_time晚于since的事件
+    :return: Change的生成器
+    '''
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            change = Change.from_dict(json.loads(line))
+            if since is None or change.write_time > since:
+                yield change
+
+class ChangeFeed(object):
+    '''
+    变更事件的分发中心，模型写表成功后调用publish()发送给所有sink
+
+    sink需实现emit(change)、flush()、close()
+    '''
+    def __init__(self):
+        self.sinks = []
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    def subscribe(self, callback, **kw):
+        '''
+        添加进程内订阅者，参数见SubscriberSink
+        '''
+        return self.add_sink(SubscriberSink(callback, **kw))
+
+    def publish(self, change):
+        for sink in self.sinks:
+            try:
+                sink.emit(change)
+            except Exception as e:
+                # 数据已写入，通知失败不影响写入结果
+                print(f'变更通知失败：{e!r}')
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
+
+# 默认的变更分发中心，未添加sink时写表不产生额外开销
+feed = ChangeFeed()
@@ -0,0 +1,165 @@
+'''
+将查询结果按列读取到定长缓冲区，供NumPy/Arrow分析使用
+'''
+
+from array import array
+from datetime import datetime, date, timedelta
+
+_EPOCH_DATE = date(1970, 1, 1)
+_EPOCH_DATETIME = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# 数据库类型 -> (array类型码, NumPy类型)
+# 日期存为1970-01-01起的天数，日期时间存为微秒数
+_TYPECODES = {
+    'TINYINT': ('b', 'int8'),
+    'SMALLINT': ('h', 'int16'),
+    'MEDIUMINT': ('i', 'int32'),
+    'INT': ('q', 'int64'),
+    'BIGINT': ('q', 'int64'),
+    'FLOAT': ('d', 'float64'),
+    'DATE': ('q', 'datetime64[D]'),
+    'DATETIME': ('q', 'datetime64[us]'),
+}
+
+def _to_date(v):
+    return (v - _EPOCH_DATE).days
+
+def _to_datetime(v):
+    return (v - _EPOCH_DATETIME) // _MICROSECOND
+
+_CONVERTERS = {
+    'DATE': _to_date,
+    'DATETIME': _to_datetime,
+}
+
+class Column(object):
+    '''
+    单列缓冲区
+
+    :param field: 列对应字段
+    :param int size: 预分配行数
+    :param values: 定长类型为array.array，文字类型为list
+    :param bytearray mask: NULL标记，1表示该行为NULL
+    '''
+    def __init__(self, field, size=0):
+        self.field = field
+        self.typecode, self.dtype = _TYPECODES.get(field._type, (None, 'object'))
+        self.values = array(self.typecode, bytes(array(self.typecode).itemsize * size)) \
+            if self.typecode else [None] * size
+        self.mask = bytearray(size)
+        self.has_null = False
+
+    def __len__(self):
+        return len(self.values)
+
+    def fill(self, start, data):
+        '''
+        从start行开始写入一批数据
+        :param int start: 起始行
+        :param tuple data: 该列的一批值
+        '''
+        end = start + len(data)
+        if end > len(self.values):
+            self._grow(end)
+
+        if None in data:
+            self.has_null = True
+            for i, v in enumerate(data, start):
+                if v is None:
+                    self.mask[i] = 1
+            data = [0 if v is None else v for v in data] if self.typecode else data
+
+        convert = _CONVERTERS.get(self.field._type)
+        if self.typecode:
+            if convert:
+                data = [convert(v) if v else 0 for v in data]
+            self.values[start:end] = array(self.typecode, data)
+        else:
+            self.values[start:end] = data
+
+    def _grow(self, size):
+        '''
+        扩容到至少size行，每次至少翻倍，行数未知时逐批写入的总复制量与行数成正比
+        '''
+        extra = max(size - len(self.values), len(self.values))
+        self.values.extend(array(self.typecode, bytes(self.values.itemsize * extra))
+                           if self.typecode else [None] * extra)
+        self.mask.extend(bytes(extra))
+
+    def truncate(self, size):
+        del self.values[size:]
+        del self.mask[size:]
+
+def read_columns(batches, fields, size=0):
+    '''
+    将分批读取的元组数据按列写入缓冲区
+    :param batches: 元组列表的迭代器
+    :param list fields: 与元组顺序一致的字段
+    :param int size: 预估行数，用于预分配缓冲区；为0时按写入的数据翻倍扩容，最后截断到实际行数
+    :return: {字段名: Column}
+    '''
+    columns = [Column(field, size) for field in fields]
+    row = 0
+    for batch in batches:
+        for column, data in zip(columns, zip(*batch)):
+            column.fill(row, data)
+        row += len(batch)
+
+    for column in columns:
+        column.truncate(row)
+
+    return {column.field.name: column for column in columns}
+
+def to_numpy(columns):
+    '''
+    转换为NumPy数组，定长列直接共享缓冲区内存，含NULL的列返回masked array
+    :param dict columns: read_columns的返回值
+    :return: {字段名: ndarray}
+    '''
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError('to_numpy需要安装numpy')
+
+    ret = {}
+    for name, column in columns.items():
+        if column.typecode:
+            dtype = 'int64' if column.dtype.startswith('datetime64') else column.dtype
+            data = np.frombuffer(column.values, dtype=dtype) if len(column) else np.empty(0, dtype=dtype)
+            if column.dtype.startswith('datetime64'):
+                data = data.view(column.dtype)
+        else:
+            data = np.empty(len(column), dtype=object)
+            data[:] = column.values
+
+        if column.has_null:
+            data = np.ma.masked_array(data, mask=np.frombuffer(column.mask, dtype=bool))
+        ret[name] = data
+
+    return ret
+
+def to_arrow(columns):
+    '''
+    转换为pyarrow.Table，NULL由mask转换为Arrow的空值
+    :param dict columns: read_columns的返回值
+    :return: pyarrow.Table
+    '''
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError('to_arrow需要安装pyarrow')
+
+    arrays = []
+    for name, column in columns.items():
+        if column.typecode:
+            data = to_numpy({name: column})[name]
+            if column.has_null:
+                data = pa.array(data.data, mask=data.mask)
+            else:
+                data = pa.array(data)
+        else:
+            data = pa.array(column.values, type=pa.string())
+        arrays.append(data)
+
+    return pa.Table.from_arrays(arrays, names=list(columns.keys()))
@@ -0,0 +1,247 @@
+'''
+存储的计算字段：写入依赖字段时只标记受影响的记录，写入提交后或读取前（flush）按批重新计算并写回，
+事务中的写入在提交后才标记并重算，回滚时不标记，进程退出时仍未重算的标记由flush_all()重算
+
+依赖可以是本模型的字段，也可以是经过Many2one的路径，如'cates.name'：
+写入user.cate的name时，只重算cates指向这些记录的用户
+'''
+
+import atexit
+import itertools
+from datetime import datetime
+
+from equipsedit.errors import FieldError
+
+# 表名 -> 模型类，定义模型类时自动注册
+registry = {}
+
+# 标记按写入的数据库连接器区分，分片模型的记录在各自的分片上重算
+# (连接器, 表名, 计算字段名) -> 需重算的ID集合，None表示全部记录
+_dirty = {}
+# (连接器, 表名, 计算字段名, Many2one字段名) -> 被写入的目标记录ID集合，None表示全部
+_dirty_via = {}
+
+# 正在flush的连接器，重算写回时发布的变更不再进入flush，由外层循环处理
+_flushing = []
+
+# 表名 -> [(计算字段所在表, 计算字段名, 经过的Many2one字段名或None, 依赖的字段名)]
+_dependents = None
+# 表名 -> 计算字段名列表
+_computed = {}
+
+def register(cls):
+    global _dependents
+    registry[cls._get_name(cls)] = cls
+    _dependents = None
+
+def _chunked(ids, size):
+    iterator = iter(ids)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _comodel(table, field):
+    return table if field.comodel == 'self' else field.comodel
+
+def dependents():
+    '''
+    根据所有模型的depends建立反向依赖表，模型注册后重新建立
+    '''
+    global _dependents
+    if _dependents is not None:
+        return _dependents
+
+    # 计算字段所在的模块可能尚未导入，先导入，使跨模型依赖完整
+    from equipsedit import loader
+    loader.load_computed()
+
+    deps = {}
+    _computed.clear()
+    for table, cls in registry.items():
+        _fields = {field.name: field for field in cls()._get_fields()}
+        for field in _fields.values():
+            if not field.compute:
+                continue
+            _computed.setdefault(table, []).append(field.name)
+            for dep in field.depends:
+                name, _, remote = dep.partition('.')
+                if name not in _fields or name == field.name:
+                    raise FieldError(f'{field._name}.depends')
+                deps.setdefault(table, []).append((table, field.name, None, name))
+                if remote:
+                    if not _fields[name].is_m2o_key:
+                        raise FieldError(f'{field._name}.depends')
+                    deps.setdefault(_comodel(table, _fields[name]), []).append((table, field.name, name, remote))
+
+    _dependents = deps
+    return deps
+
+def _add(dirty, key, ids):
+    if ids is None or dirty.get(key, ()) is None:
+        dirty[key] = None
+    else:
+        dirty.setdefault(key, set()).update(ids)
+
+def mark(model, op, ids=None, names=None):
+    '''
+    写表后标记需重算的计算字段，不访问数据库
+    :param model: 写入的模型，分片模型需绑定到记录所在的分片
+    :param str op: 操作，见changes.OPS
+    :param list ids: 写入的记录ID，为None时视为全部记录
+    :param list names: 写入的字段
+    '''
+    db = model._db
+    table = model._get_name()
+    deps = dependents().get(table)
+    # 新插入的记录需计算所有计算字段
+    computed = _computed.get(table, []) if op in ('create', 'upsert', 'import') else []
+    if not (deps or computed):
+        return
+
+    names = set(names or ())
+    for name in computed:
+        _add(_dirty, (db, table, name), ids)
+
+    for target, name, via, dep in deps or ():
+        if via is None:
+            if op != 'delete' and dep in names:
+                _add(_dirty, (db, target, name), ids)
+        elif op == 'delete' or dep in names:
+            _add(_dirty_via, (db, target, name, via), ids)
+
+def has_dirty(connector=None):
+    '''
+    :param connector: 只判断该连接器上的标记，为空时判断全部
+    '''
+    if connector is None:
+        return bool(_dirty or _dirty_via)
+    return any(key[0] is connector for key in itertools.chain(_dirty, _dirty_via))
+
+def _resolve_via(connector, chunk_size):
+    '''
+    将Many2one目标记录的ID转换为引用它们的记录ID
+    '''
+    items = [(key, ids) for key, ids in _dirty_via.items() if key[0] is connector]
+    for key, ids in items:
+        del _dirty_via[key]
+        dirty = key[:3]
+        table, via = key[1], key[3]
+        if ids is None:
+            _add(_dirty, dirty, None)
+            continue
+        for chunk in _chunked(ids, chunk_size):
+            connector.execute(f'SELECT id FROM {table} WHERE {via} IN ({",".join(["%s"] * len(chunk))})', chunk)
+            _add(_dirty, dirty, [row['id'] for row in connector.cursor.fetchall()])
+
+def _read_records(connector, model, field, ids):
+    '''
+    读取重算所需的记录：id、本模型依赖字段，以及Many2one路径的值（键为'cates.name'）
+    '''
+    table = model._get_name()
+    local = list(dict.fromkeys(['id'] + [dep.partition('.')[0] for dep in field.depends]))
+    connector.execute(f'SELECT {",".join(local)} FROM {table} WHERE id IN ({",".join(["%s"] * len(ids))})', ids)
+    records = model._decode_rows(connector.cursor.fetchall())
+
+    remotes = {}
+    for dep in field.depends:
+        via, _, remote = dep.partition('.')
+        if remote:
+            remotes.setdefault(via, []).append(remote)
+
+    for via, names in remotes.items():
+        m2o = model.__dict__[via]
+        reference = m2o.reference or 'id'
+        keys = list({record[via] for record in records if record[via] is not None})
+        rows = {}
+        if keys:
+            connector.execute(f'SELECT {",".join(dict.fromkeys([reference] + names))} '
+                              f'FROM {_comodel(table, m2o)} '
+                              f'WHERE {reference} IN ({",".join(["%s"] * len(keys))})', keys)
+            rows = {row[reference]: row for row in connector.cursor.fetchall()}
+        for record in records:
+            row = rows.get(record[via])
+            for name in names:
+                record[f'{via}.{name}'] = row[name] if row else None
+
+    return records
+
+def recompute(connector, model, name, ids, chunk_size=1000):
+    '''
+    按批重算并写回计算字段，写回后发布变更，使依赖该字段的计算字段继续重算
+    :param model: 计算字段所在模型
+    :param str name: 计算字段名
+    :param ids: 需重算的记录ID，为None时重算全部记录
+    :return: 重算的行数
+    '''
+    table = model._get_name()
+    field = model.__dict__[name]
+    compute = getattr(model, field.compute) if isinstance(field.compute, str) else \
+        (lambda records: field.compute(model, records))
+    has_write_time = 'write_time' in model.__dict__
+
+    if ids is None:
+        connector.execute(f'SELECT id FROM {table}')
+        ids = [row['id'] for row in connector.cursor.fetchall()]
+
+    count = 0
+    for chunk in _chunked(sorted(ids), chunk_size):
+        records = _read_records(connector, model, field, chunk)
+        if not records:
+            continue
+        values = compute(records)
+        if has_write_time:
+            now = datetime.now()
+            sql = f'UPDATE {table} SET {name}=%s, write_time=%s WHERE id=%s'
+            args = [(value, now, record['id']) for value, record in zip(values, records)]
+        else:
+            sql = f'UPDATE {table} SET {name}=%s WHERE id=%s'
+            args = [(value, record['id']) for value, record in zip(values, records)]
+        connector.run(lambda: connector.executemany(sql, args))
+
+        written = [record['id'] for record in records]
+        model._modified('update', written, [name, 'write_time'] if has_write_time else [name])
+        count += len(written)
+
+    return count
+
+def flush(connector, chunk_size=1000, max_rounds=32):
+    '''
+    在connector上重算该连接器上已标记的计算字段；按标记顺序逐个重算，重算时新标记的字段合并到待重算集合中
+    :param int max_rounds: 同一字段最多重算次数，超过时说明depends存在循环
+    '''
+    if any(c is connector for c in _flushing):
+        return
+    _flushing.append(connector)
+    try:
+        rounds = {}
+        while has_dirty(connector):
+            _resolve_via(connector, chunk_size)
+            key = next((key for key in _dirty if key[0] is connector), None)
+            if key is None:
+                continue
+            ids = _dirty.pop(key)
+            rounds[key] = rounds.get(key, 0) + 1
+            if rounds[key] > max_rounds:
+                for k in [k for k in _dirty if k[0] is connector]:
+                    del _dirty[k]
+                raise FieldError(f'{key[1]}.{key[2]}.depends')
+            table, name = key[1:]
+            # 绑定到connector，分片模型在记录所在的分片上重算
+            model = registry[table]()
+            model._bound = connector
+            recompute(connector, model, name, ids, chunk_size)
+    finally:
+        _flushing.remove(connector)
+
+@atexit.register
+def flush_all():
+    '''
+    重算所有连接器上已标记的计算字段，进程退出时自动调用
+    '''
+    for connector in list(dict.fromkeys(key[0] for key in itertools.chain(_dirty, _dirty_via))):
+        try:
+            flush(connector)
+        except Exception as e:
+            print(f'计算字段重算失败：{e}')
@@ -0,0 +1,316 @@
+'''
+SQL方言：不同数据库在建表、占位符、插入或更新、分页、锁和表目录上的差异
+模型和字段只通过方言生成与数据库相关的SQL
+'''
+
+import sqlite3
+
+class MySQLDialect(object):
+    '''
+    MySQL方言
+
+    :param name: 方言名称
+    :param placeholder: 参数占位符，模型中统一使用%s，由format_sql转换
+    :param inline_index: 索引是否在CREATE TABLE语句中创建
+    :param load_data: 是否支持LOAD DATA LOCAL INFILE
+    :param table_options: 建表选项
+    :param partitioned: 是否支持表分区
+    '''
+    name = 'mysql'
+    placeholder = '%s'
+    inline_index = True
+    load_data = True
+    table_options = 'ENGINE=InnoDB DEFAULT CHARSET=UTF8MB4'
+    partitioned = True
+
+    # 可重试的错误码：死锁、锁等待超时
+    retry_errors = {1213: 'deadlock', 1205: 'lock_timeout'}
+    # 超时错误码：超过MAX_EXECUTION_TIME、被KILL QUERY中断、读写超时断开连接
+    timeout_errors = (3024, 1317, 2013)
+
+    def format_sql(self, sql):
+        '''
+        将模型中使用的%s占位符转换为数据库的占位符
+        '''
+        return sql
+
+    def retry_reason(self, error):
+        '''
+        判断错误是否可通过重试事务解决
+        :return: 可重试时返回原因，否则返回None
+        '''
+        code = error.args[0] if error.args else None
+        return self.retry_errors.get(code) if isinstance(code, int) else None
+
+    def is_timeout(self, error):
+        '''
+        判断错误是否由超时取消语句引起
+        '''
+        return bool(error.args) and error.args[0] in self.timeout_errors
+
+    def timeout_sql(self, sql, seconds):
+        '''
+        为SELECT语句加上服务端最长执行时间
+        '''
+        if sql.lstrip()[:6].upper() != 'SELECT':
+            return sql
+        sql = sql.lstrip()
+        return f'{sql[:6]} /*+ MAX_EXECUTION_TIME({max(int(seconds * 1000), 1)}) */{sql[6:]}'
+
+    def quote(self, value):
+        '''
+        将值转换为SQL字符串常量
+        '''
+        value = str(value).replace('\\', '\\\\').replace("'", "\\'")
+        return f"'{value}'"
+
+    #----------------------------
+    # 建表
+    #----------------------------
+    def field_type_sql(self, field):
+        return field._field_type_sql()
+
+    def auto_increment_sql(self, field):
+        return 'AUTO_INCREMENT '
+
+    def comment_sql(self, comment):
+        return f'COMMENT "{comment}"'
+
+    def primary_key_sql(self, field, extra=()):
+        '''
+        :param extra: 主键中附加的字段，如分区字段
+        '''
+        return f'PRIMARY KEY({",".join([field.name, *extra])}),'
+
+    def index_sql(self, table, field):
+        return f'INDEX ({field.name}),'
+
+    def fulltext_sql(self, table, field):
+        '''
+        全文索引，使用ngram分词支持中文
+        '''
+        return f'FULLTEXT INDEX ({field.name}) WITH PARSER ngram,'
+
+    def add_index_sql(self, table, sql):
+        '''
+        为已存在的表添加索引的语句
+        :param str sql: index_sql或fulltext_sql的结果
+        '''
+        return f'ALTER TABLE {table} ADD {sql.rstrip(",")}' if sql else ''
+
+    def indexes_sql(self):
+        '''
+        查询表中各索引第一列的SQL，参数为表名，结果列为name（列名）、type（FULLTEXT或其他）
+        '''
+        return 'SELECT COLUMN_NAME AS name, INDEX_TYPE AS type FROM information_schema.STATISTICS ' \
+               'WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND SEQ_IN_INDEX=1'
+
+    def tables_sql(self):
+        '''
+        查询当前数据库所有表名的SQL
+        '''
+        return 'SHOW TABLES'
+
+    def _partition_value(self, value):
+        if value is None:
+            return 'MAXVALUE'
+        return str(value) if isinstance(value, (int, float)) else self.quote(value)
+
+    def _partition_defs(self, kind, parts):
+        if kind == 'range':
+            return ','.join(f'PARTITION {name} VALUES LESS THAN ({self._partition_value(value)})'
+                            for name, value in parts)
+        return ','.join(f'PARTITION {name} VALUES IN ({",".join(self._partition_value(v) for v in values)})'
+                        for name, values in parts)
+
+    def partition_sql(self, kind, name, parts):
+        '''
+        建表语句的分区部分
+        :param str kind: range、list、hash（INT字段）或key（其他字段）
+        :param str name: 分区字段
+        :param parts: range为[(分区名, 上界)]，上界为None时为MAXVALUE；list为[(分区名, 取值列表)]；hash、key为分区数
+        '''
+        if kind in ('hash', 'key'):
+            return f' PARTITION BY {kind.upper()}({name}) PARTITIONS {int(parts)}'
+        return f' PARTITION BY {kind.upper()} COLUMNS({name}) ({self._partition_defs(kind, parts)})'
+
+    def reorganize_partition_sql(self, table, name, parts):
+        '''
+        将RANGE分区name拆分为parts
+        '''
+        return f'ALTER TABLE {table} REORGANIZE PARTITION {name} INTO ({self._partition_defs("range", parts)})'
+
+    def partitions_sql(self):
+        '''
+        查询表的分区及取值的SQL，参数为表名
+        '''
+        return 'SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS description ' \
+               'FROM information_schema.PARTITIONS ' \
+               'WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND PARTITION_NAME IS NOT NULL ' \
+               'ORDER BY PARTITION_ORDINAL_POSITION'
+
+    def columns_sql(self):
+        '''
+        查询表中各列实际类型的SQL，参数为表名，结果列为name、type
+        '''
+        return 'SELECT COLUMN_NAME AS name, COLUMN_TYPE AS type FROM information_schema.COLUMNS ' \
+               'WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s ORDER BY ORDINAL_POSITION'
+
+    def table_rows_sql(self, table):
+        '''
+        查询表行数的SQL，结果列为count；MySQL读取统计信息中的估算值，避免全表扫描
+        '''
+        return f'SELECT TABLE_ROWS AS count FROM information_schema.TABLES ' \
+               f'WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME={self.quote(table)}'
+
+    def modify_column_sql(self, table, column_sql):
+        '''
+        修改列类型的语句
+        :param str column_sql: 字段定义，如'name VARCHAR(32) NULL'
+        '''
+        return f'ALTER TABLE {table} MODIFY COLUMN {column_sql}'
+
+    def char_length_sql(self, name):
+        return f'CHAR_LENGTH({name})'
+
+    def byte_length_sql(self, name):
+        return f'LENGTH({name})'
+
+    #----------------------------
+    # 查询与写入
+    #----------------------------
+    def match_sql(self, name, value, mode):
+        '''
+        全文检索条件
+        :param str mode: IN NATURAL LANGUAGE MODE或IN BOOLEAN MODE
+        '''
+        return f'MATCH ({name}) AGAINST ({self.quote(value)} {mode})'
+
+    def limit_sql(self, limit=None, offset=0):
+        sql = f'LIMIT {int(limit)}' if limit is not None else ''
+        return f'{sql} OFFSET {int(offset)}' if offset else sql
+
+    def for_update_sql(self, lock='wait'):
+        '''
+        :param str lock: skip_locked跳过已锁定行，nowait遇到已锁定行报错，wait等待锁释放
+        '''
+        return {'skip_locked': 'FOR UPDATE SKIP LOCKED', 'nowait': 'FOR UPDATE NOWAIT', 'wait': 'FOR UPDATE'}[lock]
+
+    def excluded(self, name):
+        '''
+        插入或更新时，引用待插入行的字段值
+        '''
+        return f'VALUES({name})'
+
+    def upsert_sql(self, table, names, conflict_fields, updates):
+        '''
+        插入或更新语句
+        :param list names: 插入的字段
+        :param conflict_fields: 判断冲突的唯一字段
+        :param list updates: 冲突时的更新语句，如['name=VALUES(name)']
+        '''
+        return f'INSERT INTO {table} ({",".join(names)}) VALUES ({",".join(["%s"] * len(names))}) ' \
+               f'ON DUPLICATE KEY UPDATE {",".join(updates)}'
+
+class SQLiteDialect(MySQLDialect):
+    '''
+    SQLite方言：自增主键写在字段定义中，索引单独创建，
+    不支持全文索引、行锁、表分区和LOAD DATA，全文检索退化为LIKE
+    '''
+    name = 'sqlite'
+    placeholder = '?'
+    inline_index = False
+    load_data = False
+    table_options = ''
+    partitioned = False
+
+    def format_sql(self, sql):
+        return sql.replace('%s', '?')
+
+    def retry_reason(self, error):
+        if isinstance(error, sqlite3.OperationalError) and 'locked' in str(error):
+            return 'lock_timeout'
+
+    def is_timeout(self, error):
+        return isinstance(error, sqlite3.OperationalError) and 'interrupted' in str(error)
+
+    def timeout_sql(self, sql, seconds):
+        return sql
+
+    def quote(self, value):
+        value = str(value).replace("'", "''")
+        return f"'{value}'"
+
+    def field_type_sql(self, field):
+        # INTEGER PRIMARY KEY才是SQLite的自增主键
+        if field.auto_increment and field.primary_key:
+            return 'INTEGER '
+        if field._type == 'ENUM':
+            return f'VARCHAR({field.length}) '
+        return field._field_type_sql()
+
+    def auto_increment_sql(self, field):
+        return 'PRIMARY KEY AUTOINCREMENT ' if field.primary_key else ''
+
+    def comment_sql(self, comment):
+        return ''
+
+    def primary_key_sql(self, field, extra=()):
+        return '' if field.auto_increment else f'PRIMARY KEY({",".join([field.name, *extra])}),'
+
+    def index_sql(self, table, field):
+        return f'CREATE INDEX IF NOT EXISTS {table}_{field.name}_index ON {table} ({field.name})'
+
+    def fulltext_sql(self, table, field):
+        return ''
+
+    def add_index_sql(self, table, sql):
+        # 索引本来就是单独创建的
+        return sql
+
+    def indexes_sql(self):
+        return "SELECT ii.name AS name, 'BTREE' AS type FROM pragma_index_list(%s) il " \
+               "JOIN pragma_index_info(il.name) ii WHERE ii.seqno=0"
+
+    def tables_sql(self):
+        return "SELECT name FROM sqlite_master WHERE type='table'"
+
+    def partition_sql(self, kind, name, parts):
+        return ''
+
+    def partitions_sql(self):
+        return ''
+
+    def columns_sql(self):
+        return 'SELECT name, type FROM pragma_table_info(%s)'
+
+    def table_rows_sql(self, table):
+        return f'SELECT COUNT(*) AS count FROM {table}'
+
+    def modify_column_sql(self, table, column_sql):
+        # SQLite不支持修改列类型，需重建表
+        return ''
+
+    def char_length_sql(self, name):
+        return f'LENGTH({name})'
+
+    def byte_length_sql(self, name):
+        return f'LENGTH(CAST({name} AS BLOB))'
+
+    def match_sql(self, name, value, mode):
+        value = str(value).replace('%', '\\%').replace('_', '\\_')
+        return f"{name} LIKE {self.quote(f'%{value}%')} ESCAPE '\\'"
+
+    def for_update_sql(self, lock='wait'):
+        # SQLite写事务本身是串行的，无需行锁
+        return ''
+
+    def excluded(self, name):
+        return f'excluded.{name}'
+
+    def upsert_sql(self, table, names, conflict_fields, updates):
+        return f'INSERT INTO {table} ({",".join(names)}) VALUES ({",".join(["%s"] * len(names))}) ' \
+               f'ON CONFLICT ({",".join(conflict_fields)}) DO UPDATE SET {",".join(updates)}'
+
+mysql = MySQLDialect()
+sqlite = SQLiteDialect()
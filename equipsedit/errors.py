@@ -3,4 +3,54 @@ class FieldError(Exception):
         self.name = name
 
     def errors(self):
-        print(f'属性{self.name}不存在')
\ No newline at end of file
+        print(f'属性{self.name}不存在')
+
+class FieldValueError(Exception):
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def errors(self):
+        print(f'属性{self.name}的值{self.value}不合法')
+
+class UniqueFieldError(FieldError):
+    def errors(self):
+        print(f'属性{self.name}不是唯一约束字段')
+
+class ConcurrencyError(Exception):
+    def __init__(self, model, ids):
+        self.model = model
+        self.ids = ids
+
+    def errors(self):
+        print(f'{self.model}记录{self.ids}已被其他用户修改')
+
+class QueryTimeout(Exception):
+    def __init__(self, sql):
+        self.sql = sql
+
+    def errors(self):
+        print(f'SQL语句执行超时：{self.sql}')
+
+class PipelineTransactionError(Exception):
+    def errors(self):
+        print('批量语句在独立的连接和事务中执行，不能在transaction()或run()中使用')
+
+class WorkerIdError(Exception):
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+
+    def errors(self):
+        if self.worker_id is None:
+            print('分片写入需通过环境变量EQUIPSEDIT_WORKER_ID指定进程号')
+        else:
+            print(f'进程号{self.worker_id}沿用自父进程，子进程需重新指定EQUIPSEDIT_WORKER_ID')
+
+class PipelineError(Exception):
+    def __init__(self, index, sql, error):
+        self.index = index
+        self.sql = sql
+        self.error = error
+
+    def errors(self):
+        print(f'批量语句第{self.index + 1}条执行失败，已全部回滚：{self.sql}，{self.error}')
\ No newline at end of file
@@ -1,4 +1,5 @@
-from equipsedit.errors import FieldError
+from equipsedit.errors import FieldError, FieldValueError
+from equipsedit import dialects
 
 DEFAULT = object()
 
@@ -21,6 +22,11 @@ class BaseField(object):
     :param bool is_str: 是否为文字
     :param bool auto_increment: 是否自增
     :param bool 是否为外键字段
+    :param bool fulltext: 是否建立全文索引（ngram分词，用于__match查询）
+    :param codec: 列中存储编码时为编码 -> 值的序列，读写时由encode、decode转换
+    :param compute: 计算字段的计算方法名或函数，结果存储在列中；参数为记录字典列表
+                    （包含id和depends中的字段），返回与记录顺序一致的值列表
+    :param tuple depends: 计算字段依赖的字段，可经过Many2one，如('source', 'cates.name')
 
     """
     _name = None
@@ -39,6 +45,10 @@ class BaseField(object):
     is_m2o_key = False
     is_o2m_key = False
     is_m2m_key = False
+    fulltext = False
+    compute = None
+    depends = ()
+    codec = None
     value = None
 
     def __init__(self, string='', **kw):
@@ -56,29 +66,108 @@ class BaseField(object):
         '''
         return f'{self._type}({self.length}) ' if self.length else f'{self._type} '
 
-    def get_sql(self):
+    def get_sql(self, dialect=dialects.mysql):
         sql = f'{self.name} '
-        sql += self._field_type_sql()
+        sql += dialect.field_type_sql(self)
         sql += 'NULL ' if self.null and not self.primary_key else 'NOT NULL '
         if self.auto_increment:
-            sql += 'AUTO_INCREMENT '
-        sql += f'COMMENT "{self.comment}",'
+            sql += dialect.auto_increment_sql(self)
+        sql += f'{dialect.comment_sql(self.comment)},'
 
         return sql
 
+    def convert_to_column(self, value):
+        '''
+        校验外部输入值（如CSV文本）并转换为数据库列值，空值返回None
+        '''
+        if value is None or value == '':
+            if not self.null and not self.auto_increment:
+                raise FieldValueError(self.name, value)
+            return None
+
+        try:
+            return self._convert(value)
+        except (TypeError, ValueError):
+            raise FieldValueError(self.name, value)
+
+    def _convert(self, value):
+        return int(value) if self._type in ('INT', 'BIGINT') else value
+
+    def encode(self, value):
+        '''
+        字段值转换为列中存储的值
+        '''
+        return value
+
+    def decode(self, value):
+        '''
+        列中存储的值转换为字段值
+        '''
+        return value
+
+# 整数类型及取值范围，从小到大
+INT_TYPES = (
+    ('TINYINT', -2 ** 7, 2 ** 7 - 1),
+    ('SMALLINT', -2 ** 15, 2 ** 15 - 1),
+    ('MEDIUMINT', -2 ** 23, 2 ** 23 - 1),
+    ('INT', -2 ** 31, 2 ** 31 - 1),
+    ('BIGINT', -2 ** 63, 2 ** 63 - 1),
+)
+
+def int_type(low, high):
+    '''
+    能存放[low, high]的最小整数类型
+    '''
+    for _type, minimum, maximum in INT_TYPES:
+        if minimum <= low and high <= maximum:
+            return _type
+    raise ValueError((low, high))
+
+def decode_rows(_fields, rows):
+    '''
+    将按字段顺序读取的元组中编码存储的列解码
+    :param list _fields: 与元组顺序一致的字段
+    :param rows: 元组列表
+    :return: 元组列表，没有编码列时原样返回
+    '''
+    decodes = [field.decode if field.codec else None for field in _fields]
+    if not any(decodes):
+        return rows
+    return [tuple(decode(v) if decode else v for decode, v in zip(decodes, row)) for row in rows]
+
 class Char(BaseField):
     def __init__(self, *args, **kw):
         super(Char, self).__init__(*args, **kw)
-        self._type = "CHAR"
+        self._type = "VARCHAR"
         if not self.length:
             self.length = 128
         self.is_str = True
 
+    def _convert(self, value):
+        value = str(value)
+        if len(value) > self.length:
+            raise ValueError(value)
+        return value
+
 class Int(BaseField):
     def __init__(self, *args, **kw):
         super(Int, self).__init__(*args, **kw)
         self._type = "INT"
 
+    def _convert(self, value):
+        return int(value)
+
+class BigInt(Int):
+    '''
+    64位整数，分片模型的主键使用
+    '''
+    def __init__(self, *args, **kw):
+        super(BigInt, self).__init__(*args, **kw)
+        self._type = "BIGINT"
+
+    def _convert(self, value):
+        return int(value)
+
 class Float(BaseField):
     """
         :param int length: 浮点型总长度
@@ -96,11 +185,17 @@ class Float(BaseField):
     def _field_type_sql(self):
         return f'{self._type}({self.length},{self.decimal}) ' if self.length else f'{self._type}(,{self.decimal}) '
 
+    def _convert(self, value):
+        return float(value)
+
 class Text(BaseField):
     def __init__(self, *args, **kw):
         super(Text, self).__init__(*args, **kw)
         self._type = "TEXT"
 
+    def _convert(self, value):
+        return str(value)
+
 from datetime import datetime, date
 
 class Date(BaseField):
@@ -112,6 +207,11 @@ class Date(BaseField):
     def today(self):
         return date.today()
 
+    def _convert(self, value):
+        if isinstance(value, datetime):
+            return value.date()
+        return value if isinstance(value, date) else date.fromisoformat(value)
+
 class Datetime(BaseField):
     def __init__(self, *args, **kw):
         super(Datetime, self).__init__(*args, **kw)
@@ -121,13 +221,35 @@ class Datetime(BaseField):
     def now(self):
         return datetime.now()
 
+    def _convert(self, value):
+        return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
 class Selection(BaseField):
     """
+    整数选项存储为能放下所有选项的最小整数类型；
+    文字选项默认存储为选项序号（TINYINT），读写时按codec转换，因此只能在选项末尾追加新选项
+
     :param dict selects: 字段选项对应map
+    :param str store: 文字选项的存储方式，code为选项序号，enum为ENUM（SQLite为VARCHAR），char为VARCHAR
     """
+    store = 'code'
+
     def __init__(self, selects, *args, **kw):
         super(Selection, self).__init__(*args, **kw)
-        self.selects, self._type = self._check_input(selects)
+        self.selects, key_type = self._check_input(selects)
+        if self.store not in ('code', 'enum', 'char'):
+            raise FieldError(f'{self.name}.store')
+
+        if key_type == 'INT':
+            self._type = int_type(min(self.selects, default=0), max(self.selects, default=0))
+        elif self.store == 'code':
+            self.codec = tuple(self.selects)
+            self._codes = {key: code for code, key in enumerate(self.codec)}
+            self._type = int_type(0, len(self.codec) - 1)
+        else:
+            self._type = 'ENUM' if self.store == 'enum' else 'VARCHAR'
+            self.length = max(len(key) for key in self.selects)
+        self.is_str = key_type == 'CHAR' and self.codec is None
 
     def _check_input(self, selects):
         if isinstance(selects, list):
@@ -149,6 +271,31 @@ class Selection(BaseField):
         else:
             raise FieldError(self.name)
 
+    def _field_type_sql(self):
+        if self._type == 'ENUM':
+            return f'ENUM({",".join(dialects.mysql.quote(key) for key in self.selects)}) '
+        return super(Selection, self)._field_type_sql()
+
+    def _convert(self, value):
+        if self.codec is None and not self.is_str:
+            value = int(value)
+        if value not in self.selects:
+            raise ValueError(value)
+        return self.encode(value)
+
+    def encode(self, value):
+        if self.codec is None or value is None:
+            return value
+        try:
+            return self._codes[value]
+        except (KeyError, TypeError):
+            raise FieldValueError(self.name, value)
+
+    def decode(self, value):
+        if self.codec is None or value is None:
+            return value
+        return self.codec[value]
+
 class _Foreign(BaseField):
     """
     :param comodel: 目标模型
@@ -163,14 +310,27 @@ class _Foreign(BaseField):
         self.index = False
         self.auto_increment = False
 
+def _primary_key(comodel):
+    '''
+    获取模型的主键字段
+    :return: (字段名, 字段)
+    '''
+    for k in dir(comodel):
+        v = getattr(comodel, k)
+        if isinstance(v, BaseField) and v.primary_key:
+            return k, v
+
+    raise FieldError(f'{comodel._name}.primary_key')
+
 class Many2one(_Foreign):
     reference = None
     def __init__(self, comodel=DEFAULT, *args, **kw):
         super(Many2one, self).__init__(*args, **kw)
         if comodel != 'self':
-            self.is_str = comodel.primary_key.is_str
-            self.reference = comodel.primary_key
-            self._type = comodel.primary_key._type
+            name, primary_key = _primary_key(comodel)
+            self.is_str = primary_key.is_str
+            self.reference = name
+            self._type = primary_key._type
 
         self.comodel = comodel._get_name(comodel) if comodel != 'self' else comodel
         self.is_m2o_key = True
@@ -183,7 +343,7 @@ class One2many(_Foreign):
         self.inverse_field = inverse_field
         self.is_o2m_key = True
 
-    def get_sql(self):
+    def get_sql(self, dialect=dialects.mysql):
         return
 
 class Many2many(_Foreign):
@@ -195,14 +355,14 @@ class Many2many(_Foreign):
         self.column2 = column2
         self.is_m2m_key = True
 
-    def get_sql(self):
+    def get_sql(self, dialect=dialects.mysql):
         return
 
-    def _create_rel_table(self):
+    def _create_rel_table(self, dialect=dialects.mysql):
         sql = f'CREATE TABLE {self.rel_name}(' \
               f'{self.column1} INT NOT NULL, {self.column2} INT NOT NULL,' \
               f'FOREIGN KEY({self.column1}) REFERENCES %s({self._model}) ON DELETE {self.on_delete}  ON UPDATE {self.on_delete},' \
               f'FOREIGN KEY({self.column2}) REFERENCES %s({self.comodel}) ON DELETE {self.on_delete}  ON UPDATE {self.on_delete}' \
-              f')ENGINE=InnoDB DEFAULT CHARSET=UTF8MB4;'
+              f'){dialect.table_options};'
 
         return sql
\ No newline at end of file
@@ -0,0 +1,327 @@
+'''
+模型的延迟加载与编译缓存
+
+启动时不导入apps下的模块，而是扫描模块源码得到模型名 -> 模块的清单，首次使用模型时才导入；
+源码未修改的模块直接沿用清单中的结果，无需重新解析。
+模型的字段信息、建表语句和语句模板缓存到磁盘，以模型所在模块文件的修改时间和大小为键，
+热启动时读取缓存文件即可，模块文件修改后键不同，自动重新生成
+'''
+
+import os
+import ast
+import json
+import hashlib
+import sys
+import importlib
+import importlib.util
+import getpass
+import tempfile
+
+from equipsedit import models
+from equipsedit import cache
+from equipsedit import compute
+
+# 模型所在的包，可通过环境变量EQUIPSEDIT_APPS指定，多个包以逗号分隔
+PACKAGES = [p.strip() for p in os.environ.get('EQUIPSEDIT_APPS', 'equipsedit.apps').split(',') if p.strip()]
+# 缓存目录，可通过环境变量EQUIPSEDIT_MODEL_CACHE指定，默认按用户区分
+# 清单中的模块会被导入、编译缓存中的建表语句会被执行，目录只允许当前用户写入，见cache.private_dir
+CACHE_DIR = os.environ.get('EQUIPSEDIT_MODEL_CACHE') or \
+    os.path.join(tempfile.gettempdir(), f'equipsedit_models_{getpass.getuser()}')
+
+# 缓存格式或编译内容变化时修改，使旧缓存失效
+VERSION = 2
+
+_manifest = None
+# (模型类, 方言名) -> 编译结果
+_compiled = {}
+# 已检查过的缓存目录
+_checked = set()
+
+def _private(path):
+    '''
+    创建并检查缓存文件所在的目录，目录在CACHE_DIR下时同时检查CACHE_DIR
+    '''
+    directory = os.path.dirname(path)
+    for path in ([CACHE_DIR] if os.path.dirname(directory) == CACHE_DIR else []) + [directory]:
+        if path not in _checked:
+            cache.private_dir(path)
+            _checked.add(path)
+
+def _write(path, data):
+    '''
+    先写临时文件再替换，避免其他进程读到写了一半的文件
+    '''
+    _private(path)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def _read(path):
+    _private(path)
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return data if data.get('version') == VERSION else None
+
+#----------------------------
+# 模型清单与延迟导入
+#----------------------------
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+def _parse(path):
+    '''
+    解析模块源码中的模型类，只识别类中直接赋值的_name、_init、_shard_key
+    :return: [{'name': 模型名, 'init': 是否初始化时建表, 'computed': 是否有计算字段, 'sharded': 是否分片}]
+    '''
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), path)
+
+    ret = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        attrs = {}
+        for item in node.body:
+            if isinstance(item, ast.Assign) and len(item.targets) == 1 and isinstance(item.targets[0], ast.Name):
+                attrs[item.targets[0].id] = item.value
+        if '_name' not in attrs or not isinstance(_literal(attrs['_name']), str):
+            continue
+        ret.append({
+            'name': _literal(attrs['_name']),
+            'init': bool(_literal(attrs['_init'])) if '_init' in attrs else False,
+            'computed': any(isinstance(n, ast.keyword) and n.arg == 'compute' for n in ast.walk(node)),
+            'sharded': bool(_literal(attrs['_shard_key'])) if '_shard_key' in attrs else False,
+        })
+    return ret
+
+def _package_files(package):
+    '''
+    包中所有模块文件，不导入包本身
+    :return: [(模块名, 文件路径)]
+    '''
+    spec = importlib.util.find_spec(package)
+    if spec is None or not spec.submodule_search_locations:
+        return []
+
+    ret = []
+    for root in spec.submodule_search_locations:
+        for path, dirs, files in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '__')))
+            parts = os.path.relpath(path, root).split(os.sep)
+            prefix = '.'.join([package] + [p for p in parts if p != '.'])
+            for file in sorted(files):
+                if file.endswith('.py'):
+                    module = prefix if file == '__init__.py' else f'{prefix}.{file[:-3]}'
+                    ret.append((module, os.path.join(path, file)))
+    return ret
+
+class Manifest(object):
+    '''
+    模型名 -> 模块的清单，按文件的修改时间和大小判断是否需要重新解析
+
+    :param list packages: 模型所在的包
+    :param str path: 清单文件路径
+    '''
+    def __init__(self, packages=None, path=None):
+        self.packages = packages or PACKAGES
+        self.path = path or os.path.join(CACHE_DIR, 'manifest.json')
+        self.files = {}
+        self.models = {}
+
+    def load(self):
+        '''
+        读取清单并更新修改过的模块
+        :return: 解析的模块数
+        '''
+        data = _read(self.path)
+        old = data['files'] if data and data.get('packages') == self.packages else {}
+
+        parsed = 0
+        files = {}
+        for package in self.packages:
+            for module, path in _package_files(package):
+                stat = os.stat(path)
+                entry = old.get(path)
+                if entry is None or entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+                    entry = {'module': module, 'mtime': stat.st_mtime_ns, 'size': stat.st_size,
+                             'models': _parse(path)}
+                    parsed += 1
+                files[path] = entry
+
+        self.files = files
+        self.models = {}
+        for entry in files.values():
+            for model in entry['models']:
+                self.models[model['name']] = dict(model, module=entry['module'])
+
+        if parsed or len(files) != len(old):
+            _write(self.path, {'version': VERSION, 'packages': self.packages, 'files': files})
+        return parsed
+
+def manifest():
+    '''
+    当前进程的模型清单，首次调用时读取
+    '''
+    global _manifest
+    if _manifest is None:
+        _manifest = Manifest()
+        _manifest.load()
+    return _manifest
+
+def get(name):
+    '''
+    模型名对应的模型类，所在模块未导入时导入
+    '''
+    table = name.replace('.', '_')
+    if table not in compute.registry:
+        entry = manifest().models.get(name)
+        if entry is None:
+            raise KeyError(name)
+        importlib.import_module(entry['module'])
+    return compute.registry[table]
+
+def load_all():
+    '''
+    导入清单中的所有模块
+    '''
+    for entry in manifest().models.values():
+        importlib.import_module(entry['module'])
+
+def load_computed():
+    '''
+    导入包含计算字段的模块，使计算字段的跨模型依赖完整
+    '''
+    for entry in manifest().models.values():
+        if entry['computed']:
+            importlib.import_module(entry['module'])
+
+#----------------------------
+# 编译缓存
+#----------------------------
+def fingerprint(model):
+    '''
+    编译缓存的键：模型类所在模块及字段、方言模块文件的修改时间和大小，只需os.stat，比生成编译结果更快
+    模块文件取不到时（如交互式定义的模型）返回None
+    '''
+    parts = [str(VERSION), model._db.dialect.name]
+    for module in [cls.__module__ for cls in type(model).__mro__] + ['equipsedit.fields', 'equipsedit.dialects']:
+        if module in ('equipsedit.models', 'builtins'):
+            continue
+        path = getattr(sys.modules.get(module), '__file__', None)
+        if not path:
+            return None
+        stat = os.stat(path)
+        parts.append(f'{path}:{stat.st_mtime_ns}:{stat.st_size}')
+    parts.append(type(model).__qualname__)
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+def _compile(model):
+    '''
+    生成模型的编译结果：建表语句、查询的列名
+    '''
+    model.get_fields()
+    dialect = model._db.dialect
+    table = model._get_name()
+    ddl = [model._create_table_sql()]
+    if not dialect.inline_index:
+        ddl.extend(dialect.index_sql(table, field) for field in model._slots['indexs'])
+    return {
+        'version': VERSION,
+        'table': table,
+        'ddl': ddl,
+        'columns': [field.name for field in model._column_fields()],
+    }
+
+def compiled(model):
+    '''
+    模型的编译结果，依次读取进程内缓存、磁盘缓存，都未命中时生成并写入磁盘
+    RANGE分区的建表语句与当前日期有关，不缓存
+    :return: {'table': 表名, 'ddl': 建表语句列表, 'columns': 列名列表}
+    '''
+    memo = (type(model), model._db.dialect.name)
+    ret = _compiled.get(memo)
+    if ret is not None:
+        return ret
+
+    key = fingerprint(model)
+    path = os.path.join(CACHE_DIR, 'compiled', f'{model._name}.json')
+    ret = _read(path) if key else None
+    if ret is None or ret.get('key') != key:
+        ret = _compile(model)
+        if key:
+            ret['key'] = key
+            _write(path, ret)
+
+    if model._partitioned():
+        ret = dict(ret, ddl=_compile(model)['ddl'])
+    _compiled[memo] = ret
+    return ret
+
+def clear():
+    '''
+    清除进程内和磁盘上的编译缓存与清单
+    '''
+    global _manifest
+    _manifest = None
+    _compiled.clear()
+    directory = os.path.join(CACHE_DIR, 'compiled')
+    if os.path.isdir(directory):
+        for file in os.listdir(directory):
+            os.remove(os.path.join(directory, file))
+    if os.path.exists(os.path.join(CACHE_DIR, 'manifest.json')):
+        os.remove(os.path.join(CACHE_DIR, 'manifest.json'))
+
+#----------------------------
+# 建表
+#----------------------------
+def create_tables(names=None, connector=None):
+    '''
+    创建尚未建表的模型，只查询一次表目录，表已存在的模型所在模块不导入
+    Many2one引用的模型先建表
+    :param list names: 模型名，为空时为清单中_init为True的模型
+    :param connector: 数据库连接器，为空时使用models.Connector
+    :return: 新建表的模型类列表
+    '''
+    connector = connector or models.Connector
+    if names is None:
+        names = [name for name, entry in manifest().models.items() if entry['init']]
+    tables = set(connector.tables())
+    created = []
+
+    def create(cls):
+        model = cls()
+        table = model._get_name()
+        if table in tables and not model._sharded():
+            return
+        tables.add(table)
+        for field in model._get_fields():
+            if field.is_m2o_key and field.comodel != 'self' and field.comodel not in tables \
+                    and field.comodel in compute.registry:
+                create(compute.registry[field.comodel])
+        model.create_table()
+        created.append(cls)
+
+    for name in names:
+        # 先按清单判断表是否存在，表已存在时不导入模型所在模块；分片模型的表在各分片上，需导入后检查
+        entry = manifest().models.get(name)
+        if entry and name.replace('.', '_') in tables and not (entry['sharded'] and models.Shards is not None):
+            continue
+        create(get(name))
+    return created
+
+def update_tables(names=None):
+    '''
+    为已建表的模型补建模型中新增的索引，需导入模型所在模块，在部署新版本后执行
+    :param list names: 模型名，为空时为清单中_init为True的模型
+    :return: 执行的语句
+    '''
+    if names is None:
+        names = [name for name, entry in manifest().models.items() if entry['init']]
+    return [sql for name in names for sql in get(name)().update_table()]
@@ -0,0 +1,311 @@
+'''
+表分区：按模型的_partition_by生成RANGE/LIST/HASH分区建表语句，
+查询时由MySQL根据WHERE条件裁剪分区，旧分区可归档到压缩表或文件
+'''
+
+import re
+import gzip
+import json
+from datetime import datetime, timedelta
+
+from equipsedit import fields
+from equipsedit.errors import FieldError, FieldValueError
+
+KINDS = ('range', 'list', 'hash')
+INTERVALS = ('day', 'month', 'year')
+
+# 最后一个RANGE分区，存放超出预建区间的数据
+MAXVALUE_PARTITION = 'pmax'
+
+def _floor(value, interval):
+    if isinstance(interval, int):
+        return value - value % interval
+    if interval == 'year':
+        return value.replace(month=1, day=1)
+    if interval == 'month':
+        return value.replace(day=1)
+    return value
+
+def _next(value, interval):
+    if isinstance(interval, int):
+        return value + interval
+    if interval == 'day':
+        return value + timedelta(days=1)
+    if interval == 'month':
+        return value.replace(year=value.year + value.month // 12, month=value.month % 12 + 1)
+    return value.replace(year=value.year + 1)
+
+def _partition_name(lower, interval):
+    if isinstance(interval, int):
+        return f'p{lower}'
+    return 'p' + lower.strftime({'day': '%Y%m%d', 'month': '%Y%m', 'year': '%Y'}[interval])
+
+class Partition(object):
+    '''
+    模型的分区定义，由_partition_by生成
+
+    :param str kind: range、list或hash
+    :param str field: 分区字段
+    :param arg: range为区间（DATE/DATETIME字段为day、month、year，INT字段为整数步长），
+                list为{分区名: 取值列表}，hash为分区数
+    '''
+    def __init__(self, kind, field, arg):
+        if kind not in KINDS:
+            raise FieldError(f'_partition_by.{kind}')
+        self.kind = kind
+        self.field = field
+        self.arg = arg
+
+    @classmethod
+    def of(cls, model):
+        return cls(*model._partition_by) if model._partition_by else None
+
+    def check(self, model):
+        '''
+        校验分区字段：MySQL要求主键和唯一约束都包含分区字段，且分区表不支持全文索引
+        '''
+        field = model.__dict__.get(self.field)
+        if field is None or field.is_o2m_key or field.is_m2m_key:
+            raise FieldError(f'{model._name}._partition_by')
+        if self.kind == 'range':
+            if isinstance(self.arg, int) != (field._type in ('INT', 'BIGINT')) or \
+                    not isinstance(self.arg, int) and self.arg not in INTERVALS:
+                raise FieldError(f'{model._name}._partition_by')
+        if any(f.unique and f.name != self.field or f.fulltext for f in model._get_fields()):
+            raise FieldError(f'{model._name}._partition_by')
+        return field
+
+    def definitions(self, start, count):
+        '''
+        RANGE分区定义：从start所在区间开始的count个区间，第一个分区同时存放更早的数据
+        :return: [(分区名, 上界)]，上界不包含在分区内
+        '''
+        lower = _floor(start, self.arg)
+        ret = []
+        for _ in range(count):
+            upper = _next(lower, self.arg)
+            ret.append((_partition_name(lower, self.arg), upper))
+            lower = upper
+        return ret
+
+    def create_sql(self, model, dialect, ahead=3):
+        '''
+        建表语句中的分区部分
+        :param int ahead: RANGE分区预建的区间数
+        '''
+        field = self.check(model)
+        if self.kind == 'range':
+            start = 0 if field._type in ('INT', 'BIGINT') else datetime.now().date()
+            parts = self.definitions(start, ahead + 1) + [(MAXVALUE_PARTITION, None)]
+            return dialect.partition_sql('range', self.field, parts)
+        if self.kind == 'list':
+            return dialect.partition_sql('list', self.field, list(self.arg.items()))
+        return dialect.partition_sql('hash' if field._type in ('INT', 'BIGINT') else 'key', self.field, int(self.arg))
+
+    #----------------------------
+    # 分区裁剪
+    #----------------------------
+    def current(self, connector, table):
+        '''
+        读取数据库中当前的分区
+        :return: [(分区名, 取值)]，RANGE为上界（MAXVALUE为None），LIST为取值列表，HASH为None
+        '''
+        sql = connector.dialect.partitions_sql()
+        parts = []
+        if sql:
+            connector.execute(sql, (table,))
+            parts = [(row['name'], row['description']) for row in connector.cursor.fetchall()]
+        return parts
+
+    def _parse(self, field, description):
+        if self.kind == 'hash' or description is None:
+            return None
+        values = [a or b for a, b in re.findall(r"'((?:[^'\\]|\\.)*)'|(-?\d+(?:\.\d+)?)", description)]
+        values = [field.convert_to_column(v) for v in values]
+        if self.kind == 'range':
+            return values[0] if values else None
+        return values
+
+    def prune(self, model, connector, leaves):
+        '''
+        根据以AND连接的条件确定会读取的分区
+        :param leaves: [(key, value)]
+        :return: 分区名列表，条件未限定分区字段时返回None
+        '''
+        leaves = [(key.partition('__')[2], value) for key, value in leaves
+                  if key.partition('__')[0] == self.field]
+        if not leaves:
+            return None
+
+        field = model.__dict__[self.field]
+        parts = [(p, self._parse(field, d)) for p, d in self.current(connector, model._get_name())]
+        if not parts:
+            return None
+
+        keep = None
+        for equi, value in leaves:
+            try:
+                matched = self._match(parts, field, equi, value)
+            except (FieldValueError, TypeError):
+                matched = None
+            if matched is not None:
+                keep = matched if keep is None else keep & matched
+
+        if keep is None:
+            return None
+        # 没有分区满足条件时查询结果必定为空，读取第一个分区即可
+        return [p for p, _ in parts if p in keep] or [parts[0][0]]
+
+    def _match(self, parts, field, equi, value):
+        values = None
+        if equi in ('', 'in'):
+            values = [field.convert_to_column(v if isinstance(v, (int, float)) else str(v))
+                      for v in (value if equi == 'in' else [value])]
+
+        if self.kind == 'hash':
+            if values is None or field._type not in ('INT', 'BIGINT'):
+                return None
+            return {f'p{v % len(parts)}' for v in values}
+
+        if self.kind == 'list':
+            if values is None:
+                return None
+            return {p for p, items in parts if any(v in items for v in values)}
+
+        if values is None:
+            if equi not in ('gt', 'gte', 'lt', 'lte'):
+                return None
+            value = field.convert_to_column(value if isinstance(value, (int, float)) else str(value))
+
+        ret = set()
+        lower = None
+        for p, upper in parts:
+            if values is not None:
+                hit = any((lower is None or lower <= v) and (upper is None or v < upper) for v in values)
+            elif equi in ('gt', 'gte'):
+                hit = upper is None or upper > value
+            elif equi == 'lt':
+                hit = lower is None or lower < value
+            else:
+                hit = lower is None or lower <= value
+            if hit:
+                ret.add(p)
+            lower = upper
+        return ret
+
+    #----------------------------
+    # 扩展与归档
+    #----------------------------
+    def extend(self, model, connector, until):
+        '''
+        在MAXVALUE分区前补建RANGE分区，直到覆盖until
+        :return: 新建的分区名
+        '''
+        table = model._get_name()
+        if self.kind != 'range' or not connector.dialect.partitioned:
+            return []
+
+        field = model.__dict__[self.field]
+        bounds = [self._parse(field, d) for _, d in self.current(connector, table)]
+        last = max((b for b in bounds if b is not None), default=None)
+        if last is None:
+            return []
+        if isinstance(last, datetime):
+            last = last.date()
+        if hasattr(until, 'date'):
+            until = until.date()
+
+        parts = []
+        while last <= until:
+            upper = _next(last, self.arg)
+            parts.append((_partition_name(last, self.arg), upper))
+            last = upper
+        if not parts:
+            return []
+
+        connector.execute(connector.dialect.reorganize_partition_sql(
+            table, MAXVALUE_PARTITION, parts + [(MAXVALUE_PARTITION, None)]))
+        return [p for p, _ in parts]
+
+    def archive(self, model, connector, before, to='table', path=None, ids=None):
+        '''
+        归档分区字段早于before的数据
+
+        支持分区的数据库：上界不晚于before的RANGE分区通过EXCHANGE PARTITION换出到同结构的空表，
+        再压缩该表或导出为文件后删除，热表只剩较新的分区；
+        不支持分区时，在事务中将旧数据复制到归档表或文件后删除
+        :param before: 截止时间
+        :param str to: table归档到压缩表，file归档为gzip压缩的JSONL文件
+        :param str path: 归档文件目录，to为file时必填
+        :param list ids: 给出时追加已归档（从热表删除）的记录ID，用于发布变更
+        :return: {'partitions': 归档的分区或表, 'rows': 行数}
+        '''
+        if to not in ('table', 'file') or to == 'file' and not path:
+            raise ValueError(to)
+
+        table = model._get_name()
+        field = model.__dict__[self.field]
+        before = field.convert_to_column(before if isinstance(before, (int, float)) else str(before))
+        ret = {'partitions': [], 'rows': 0}
+
+        if not connector.dialect.partitioned:
+            archive = f'{table}_archive'
+            where = f'WHERE {self.field}<%s'
+            # 事务提交后才追加ID
+            archived = [] if ids is not None else None
+            with connector.transaction():
+                ret['rows'] = self._rows(connector, table, where, (before,), archived)
+                if to == 'table':
+                    if archive not in connector.tables():
+                        connector.execute(f'CREATE TABLE {archive} AS SELECT * FROM {table} WHERE 1=0')
+                    connector.execute(f'INSERT INTO {archive} SELECT * FROM {table} {where}', (before,))
+                else:
+                    self._dump(connector, model, table, where, (before,), f'{path}/{archive}.jsonl.gz')
+                connector.execute(f'DELETE FROM {table} {where}', (before,))
+            ret['partitions'].append(archive)
+            if ids is not None:
+                ids.extend(archived)
+            return ret
+
+        if self.kind != 'range':
+            raise FieldError(f'{model._name}._partition_by')
+
+        parts = [(p, self._parse(field, d)) for p, d in self.current(connector, table)]
+        for p, upper in parts:
+            if upper is None or upper > before:
+                break
+            archive = f'{table}_{p}'
+            connector.execute(f'CREATE TABLE {archive} LIKE {table}')
+            connector.execute(f'ALTER TABLE {archive} REMOVE PARTITIONING')
+            connector.execute(f'ALTER TABLE {table} EXCHANGE PARTITION {p} WITH TABLE {archive}')
+            ret['rows'] += self._rows(connector, archive, '', None, ids)
+            if to == 'table':
+                connector.execute(f'ALTER TABLE {archive} ROW_FORMAT=COMPRESSED')
+            else:
+                self._dump(connector, model, archive, '', None, f'{path}/{archive}.jsonl.gz')
+                connector.execute(f'DROP TABLE {archive}')
+            connector.execute(f'ALTER TABLE {table} DROP PARTITION {p}')
+            ret['partitions'].append(archive)
+
+        return ret
+
+    def _rows(self, connector, table, where, args, ids=None):
+        '''
+        统计归档的行数，给出ids时改为读取记录ID并追加到ids
+        '''
+        if ids is None:
+            connector.execute(f'SELECT COUNT(*) AS count FROM {table} {where}', args)
+            return connector.cursor.fetchone()['count']
+        connector.execute(f'SELECT id FROM {table} {where}', args)
+        found = [row['id'] for row in connector.cursor.fetchall()]
+        ids.extend(found)
+        return len(found)
+
+    def _dump(self, connector, model, table, where, args, path):
+        _fields = model._column_fields()
+        names = [field.name for field in _fields]
+        with gzip.open(path, 'at', encoding='utf-8') as f:
+            for batch in connector.stream(f'SELECT {",".join(names)} FROM {table} {where}', args):
+                batch = fields.decode_rows(_fields, batch)
+                f.writelines(json.dumps(dict(zip(names, values)), ensure_ascii=False, default=str) + '\n'
+                             for values in batch)
@@ -0,0 +1,371 @@
+'''
+模型表的只读快照：列式二进制文件，编辑器通过mmap打开，无需连接数据库
+
+文件结构（列数据为本机字节序，各段按8字节对齐）：
+    文件头      b'EQSNAP\\0\\0'、格式版本(uint32)、元数据长度(uint32)
+    元数据      JSON：模型名、表名、行数、主键、最大write_time、各列的类型和偏移
+    定长列      整数/FLOAT/DATE/DATETIME为对应宽度的整数或float64数组，另有每行1字节的NULL标记；
+                编码存储的Selection列保存编码，元数据中记录编码对应的选项
+    文字列      每列rows+1个int64偏移，指向字符串堆中的UTF-8数据
+    字符串堆    所有文字列的数据
+    主键索引    按主键排序的行号数组，二分查找
+'''
+
+import os
+import json
+import mmap
+import time
+import struct
+from array import array
+from datetime import datetime, timedelta
+
+from equipsedit import columns
+from equipsedit.columns import _EPOCH_DATE, _EPOCH_DATETIME
+
+MAGIC = b'EQSNAP\0\0'
+VERSION = 1
+
+_HEADER = struct.Struct('<8sII')
+
+# Windows上快照文件被其他进程映射时替换的重试次数
+REPLACE_RETRIES = 20
+
+def _pad(n):
+    return -n % 8
+
+def _decode_date(v):
+    return _EPOCH_DATE + timedelta(days=v)
+
+def _decode_datetime(v):
+    return _EPOCH_DATETIME + timedelta(microseconds=v)
+
+_DECODERS = {
+    'DATE': _decode_date,
+    'DATETIME': _decode_datetime,
+}
+
+def _text(v):
+    if isinstance(v, bytes):
+        return v.decode('utf-8')
+    if isinstance(v, datetime):
+        return v.isoformat(' ')
+    return str(v)
+
+def write(path, model, table, fields, primary_key, batches, size=0):
+    '''
+    将分批读取的元组数据写入快照文件，先写临时文件再替换，见_replace
+    :param str path: 快照文件路径
+    :param str model: 模型名
+    :param str table: 表名
+    :param list fields: 与元组顺序一致的字段
+    :param str primary_key: 主键字段名
+    :param batches: 元组列表的迭代器
+    :param int size: 预估行数，用于预分配缓冲区
+    :return: 行数
+    '''
+    cols = columns.read_columns(batches, fields, size)
+    rows = len(cols[primary_key])
+
+    sections = []
+    offset = 0
+
+    def add(data):
+        nonlocal offset
+        start = offset
+        sections.append(data)
+        offset += len(data)
+        padding = _pad(len(data))
+        if padding:
+            sections.append(bytes(padding))
+            offset += padding
+        return start
+
+    heap = bytearray()
+    metas = []
+    for field in fields:
+        column = cols[field.name]
+        meta = {'name': field.name, 'type': field._type, 'typecode': column.typecode}
+        if field.codec:
+            meta['codec'] = list(field.codec)
+        if column.typecode:
+            meta['values'] = add(column.values.tobytes())
+        else:
+            offsets = array('q', [len(heap)]) * (rows + 1)
+            for i, v in enumerate(column.values):
+                if v is not None:
+                    heap += _text(v).encode('utf-8')
+                offsets[i + 1] = len(heap)
+            meta['values'] = add(offsets.tobytes())
+        meta['mask'] = add(bytes(column.mask)) if column.has_null else None
+        metas.append(meta)
+
+    heap_offset = add(bytes(heap))
+
+    # 主键为空的行不进入索引
+    key_column = cols[primary_key]
+    index = array('q', sorted((i for i in range(rows) if not key_column.mask[i]),
+                              key=key_column.values.__getitem__))
+    index_offset = add(index.tobytes())
+
+    write_time = cols.get('write_time')
+    max_write_time = None
+    if write_time is not None and rows:
+        times = [v for v, null in zip(write_time.values, write_time.mask) if not null]
+        if times:
+            max_write_time = _decode_datetime(max(times)).isoformat(' ')
+
+    header = json.dumps({
+        'model': model,
+        'table': table,
+        'rows': rows,
+        'primary_key': primary_key,
+        'write_time': max_write_time,
+        'created': time.time(),
+        'columns': metas,
+        'heap': [heap_offset, len(heap)],
+        'index': [index_offset, len(index)],
+    }, ensure_ascii=False).encode('utf-8')
+    header += b' ' * _pad(_HEADER.size + len(header))
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        f.writelines(sections)
+    _replace(tmp, path)
+    return rows
+
+def _replace(tmp, path, retries=REPLACE_RETRIES, delay=0.1):
+    '''
+    用临时文件替换快照文件
+    POSIX系统上已打开的读取方继续读取旧文件，不受影响；
+    Windows上被映射的文件不能替换，读取方需先close()，仍被占用时每隔delay秒重试，
+    重试retries次后删除临时文件并抛出PermissionError
+    '''
+    for i in range(retries + 1):
+        try:
+            os.replace(tmp, path)
+            return
+        except PermissionError:
+            if os.name != 'nt' or i == retries:
+                os.remove(tmp)
+                raise
+            time.sleep(delay)
+
+class Record(object):
+    '''
+    快照中的一行，读取字段时才从映射内存中解码
+
+    :param snapshot: 所属快照
+    :param int row: 行号
+    '''
+    __slots__ = ('snapshot', 'row')
+
+    def __init__(self, snapshot, row):
+        self.snapshot = snapshot
+        self.row = row
+
+    def __getitem__(self, name):
+        return self.snapshot.value(name, self.row)
+
+    def __getattr__(self, name):
+        try:
+            return self.snapshot.value(name, self.row)
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return f'<{self.snapshot.model} {self.row}>'
+
+    def to_dict(self):
+        return {name: self.snapshot.value(name, self.row) for name in self.snapshot.names}
+
+class Snapshot(object):
+    '''
+    以mmap只读打开快照文件，定长列以memoryview直接访问映射内存，不复制数据
+    Windows上打开期间快照文件不能被刷新，刷新前需close()
+
+    :param str path: 快照文件路径
+    :param str model: 模型名
+    :param str table: 表名
+    :param list names: 字段名
+    :param str write_time: 快照中最大的write_time，用于增量刷新
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []
+
+        magic, version, length = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'{path}不是版本{VERSION}的快照文件')
+
+        self.meta = json.loads(self._mmap[_HEADER.size:_HEADER.size + length].decode('utf-8'))
+        self._data = _HEADER.size + length
+        self.model = self.meta['model']
+        self.table = self.meta['table']
+        self.rows = self.meta['rows']
+        self.primary_key = self.meta['primary_key']
+        self.write_time = self.meta['write_time']
+
+        self._columns = {}
+        for meta in self.meta['columns']:
+            typecode = meta['typecode']
+            values = self._view(meta['values'], self.rows + (0 if typecode else 1), typecode or 'q')
+            mask = self._view(meta['mask'], self.rows, 'B') if meta['mask'] is not None else None
+            self._columns[meta['name']] = (meta['type'], typecode, values, mask, meta.get('codec'))
+        self.names = list(self._columns)
+
+        heap_offset, heap_size = self.meta['heap']
+        self._heap = self._view(heap_offset, heap_size, 'B')
+        self._index = self._view(self.meta['index'][0], self.meta['index'][1], 'q')
+
+    def _view(self, offset, count, typecode):
+        start = self._data + offset
+        view = memoryview(self._mmap)[start:start + count * struct.calcsize(typecode)]
+        self._views.append(view)
+        if typecode != 'B':
+            view = view.cast(typecode)
+            self._views.append(view)
+        return view
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, row):
+        if not -self.rows <= row < self.rows:
+            raise IndexError(row)
+        return Record(self, row % self.rows)
+
+    def __iter__(self):
+        return (Record(self, row) for row in range(self.rows))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def column(self, name):
+        '''
+        定长列的原始数据，DATE为1970-01-01起的天数，DATETIME为微秒数，编码存储的Selection为编码
+        可直接用numpy.frombuffer转换而不复制
+        :return: (values, mask)，mask为每行1字节的NULL标记，没有NULL时为None
+        '''
+        _type, typecode, values, mask, codec = self._columns[name]
+        if not typecode:
+            raise ValueError(f'{name}不是定长列')
+        return values, mask
+
+    def value(self, name, row):
+        _type, typecode, values, mask, codec = self._columns[name]
+        if mask is not None and mask[row]:
+            return None
+        if typecode:
+            v = values[row]
+            if codec:
+                return codec[v]
+            decode = _DECODERS.get(_type)
+            return decode(v) if decode else v
+        return bytes(self._heap[values[row]:values[row + 1]]).decode('utf-8')
+
+    def _key(self, row):
+        return self.value(self.primary_key, row)
+
+    def find(self, key):
+        '''
+        按主键二分查找行号
+        :return: 行号，不存在时返回None
+        '''
+        index = self._index
+        lo, hi = 0, len(index)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(index[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(index) and self._key(index[lo]) == key:
+            return index[lo]
+
+    def get(self, key, default=None):
+        '''
+        按主键获取记录
+        '''
+        row = self.find(key)
+        return default if row is None else Record(self, row)
+
+    def tuples(self, names=None):
+        '''
+        逐行解码为元组
+        :param list names: 字段名，为空时为全部字段
+        '''
+        names = names or self.names
+        for row in range(self.rows):
+            yield tuple(self.value(name, row) for name in names)
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+def dump(model, connector, path, incremental=True, batch_size=5000):
+    '''
+    将模型的表写入快照文件
+
+    快照已存在且字段一致时增量刷新：只读取write_time不早于快照的行，按主键替换或追加，
+    并根据当前主键列表去掉已删除的行
+    :param model: 模型
+    :param connector: 数据库连接器
+    :param str path: 快照文件路径
+    :param bool incremental: 是否增量刷新
+    :param int batch_size: 每批读取行数
+    :return: {'rows': 行数, 'changed': 读取的行数, 'deleted': 删除的行数, 'seconds': 耗时}
+    '''
+    start = time.perf_counter()
+    _fields = model._column_fields()
+    names = [field.name for field in _fields]
+    primary_key = next(field.name for field in _fields if field.primary_key)
+    query = model.search()
+
+    old = None
+    if incremental and os.path.exists(path) and 'write_time' in names:
+        try:
+            old = Snapshot(path)
+        except ValueError:
+            old = None
+        if old is not None and (old.table != model._get_name() or old.names != names or old.write_time is None):
+            old.close()
+            old = None
+
+    if old is None:
+        rows = write(path, model._name, model._get_name(), _fields, primary_key,
+                     connector.stream(query._select_sql(names), size=batch_size))
+        return {'rows': rows, 'changed': rows, 'deleted': 0, 'seconds': time.perf_counter() - start}
+
+    try:
+        # 同一秒内写入的行可能晚于快照，因此包含等于write_time的行，按主键去重
+        changed = list(model.search(write_time__gte=old.write_time))
+        keys = {row[0] for batch in connector.stream(
+            f'SELECT {primary_key} FROM {model._get_name()}', size=batch_size) for row in batch}
+        # 读取的值已解码，写入前转换回列中存储的值
+        updates = {row[primary_key]: tuple(field.encode(row[field.name]) for field in _fields) for row in changed}
+
+        kept = []
+        deleted = 0
+        pk = names.index(primary_key)
+        for values in old.tuples():
+            key = values[pk]
+            if key not in keys:
+                deleted += 1
+            elif key not in updates:
+                kept.append(tuple(field.encode(v) for field, v in zip(_fields, values)))
+        kept.extend(updates.values())
+    finally:
+        old.close()
+
+    rows = write(path, model._name, model._get_name(), _fields, primary_key, [kept], len(kept))
+    return {'rows': rows, 'changed': len(updates), 'deleted': deleted, 'seconds': time.perf_counter() - start}
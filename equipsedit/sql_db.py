@@ -1,26 +1,349 @@
-import pymysql
+import sqlite3
+import threading
+import random
+import time
+import re
+
+from contextlib import contextmanager
+from datetime import datetime, date
+from urllib.parse import urlparse, unquote
+
+from equipsedit import dialects
+from equipsedit.errors import QueryTimeout, PipelineError, PipelineTransactionError
+
+def connect(url):
+    '''
+    根据数据库地址创建连接器
+    :param str url: mysql://用户:密码@主机:端口/数据库 或 sqlite:///文件路径（sqlite:///:memory:为内存数据库）
+    '''
+    ret = urlparse(url)
+    if ret.scheme == 'mysql':
+        return Connector(ret.hostname, ret.port or 3306, unquote(ret.username or ''),
+                         unquote(ret.password or ''), ret.path.lstrip('/'))
+    if ret.scheme == 'sqlite':
+        return SQLiteConnector(ret.path[1:] if ret.path.startswith('/') else ret.path)
+
+    raise ValueError(f'不支持的数据库地址{url}')
 
 class Connector(object):
     """
         Python与Mysql连接器
+
+        :param str name: 数据库标识，如mysql://主机:端口/数据库，区分不同数据库的查询缓存
     """
+    dialect = dialects.mysql
+
     def __init__(self, host, port, user, pwd, db):
-        conn = pymysql.connect(host=host, port=port, user=user,
-                                passwd=pwd, db=db, use_unicode=True, charset="utf8")
+        # 连接MySQL时才导入驱动，只使用SQLite时无需安装pymysql
+        import pymysql
+
+        self.name = f'mysql://{host}:{port}/{db}'
+        self._params = dict(host=host, port=port, user=user, passwd=pwd, db=db,
+                            use_unicode=True, charset="utf8")
+        conn = pymysql.connect(local_infile=True, **self._params)
 
         self.conn = conn
         self.cursor = conn.cursor(cursor=pymysql.cursors.DictCursor)
+        self._init_state()
 
-    def execute(self, sql: str):
+    def _init_state(self):
+        self.in_transaction = False
+        self._callbacks = []
+        # 是否尝试LOAD DATA LOCAL INFILE，服务端或客户端禁用时由transfer改为False
+        self.local_infile = self.dialect.load_data
+        self.retry_stats = _retry_stats()
+        self.timeout_stats = {}
+        self._deadline = None
+        self._running = False
+        self._lock = threading.Lock()
+        self._side_conn = None
+        self._multi_conn = None
+
+    def execute(self, sql: str, args=None, timeout=None):
         '''
         执行sql语句
         :param str sql: sql语句
+        :param args: sql语句参数
+        :param float timeout: 超时秒数，与deadline()取较早者
+        :return:
+        '''
+        sql = self.dialect.format_sql(sql) if args is not None else sql
+        ret = self._call(sql, timeout, lambda sql: self.cursor.execute(sql, args))
+        if not self.in_transaction:
+            self.conn.commit()
+        return ret
+
+    def executemany(self, sql: str, args, timeout=None):
+        '''
+        批量执行sql语句，INSERT语句会被合并为多行插入
+        :param str sql: sql语句
+        :param args: 每行的sql语句参数
+        :param float timeout: 超时秒数，与deadline()取较早者
         :return:
         '''
-        ret = self.cursor.execute(sql)
-        self.conn.commit()
+        ret = self._call(self.dialect.format_sql(sql), timeout, lambda sql: self.cursor.executemany(sql, args))
+        if not self.in_transaction:
+            self.conn.commit()
         return ret
 
+    #----------------------------
+    # 超时控制
+    #----------------------------
+    @contextmanager
+    def deadline(self, seconds):
+        '''
+        在上下文中执行的所有语句须在seconds秒内完成，嵌套时取较早的截止时间
+        '''
+        old = self._deadline
+        end = time.monotonic() + seconds
+        self._deadline = min(old, end) if old else end
+        try:
+            yield self
+        finally:
+            self._deadline = old
+
+    def _remaining(self, timeout=None):
+        ret = [t for t in (timeout, self._deadline and self._deadline - time.monotonic()) if t is not None]
+        return min(ret) if ret else None
+
+    def _call(self, sql, timeout, func):
+        with self._timed(sql, timeout) as sql:
+            return func(sql)
+
+    @contextmanager
+    def _timed(self, sql, timeout):
+        '''
+        带超时执行语句：SELECT加上服务端最长执行时间，设置连接读写超时，
+        到期仍未完成时从另一个连接取消该语句，并抛出QueryTimeout
+        :return: 上下文中执行的sql语句
+        '''
+        remaining = self._remaining(timeout)
+        if remaining is None:
+            yield sql
+            return
+        if remaining <= 0:
+            self._timed_out(sql)
+            raise QueryTimeout(sql)
+
+        timer = threading.Timer(remaining, self._cancel)
+        timer.daemon = True
+        with self._lock:
+            self._running = True
+        self._set_socket_timeout(remaining + 1)
+        timer.start()
+        try:
+            yield self.dialect.timeout_sql(sql, remaining)
+        except Exception as e:
+            if not self.dialect.is_timeout(e):
+                raise
+            self._timed_out(sql)
+            self._recover()
+            raise QueryTimeout(sql) from e
+        finally:
+            with self._lock:
+                self._running = False
+            timer.cancel()
+            self._set_socket_timeout(None)
+
+    def _cancel(self):
+        # 持有锁时语句仍在执行，取消不会影响下一条语句
+        with self._lock:
+            if self._running:
+                self._kill()
+
+    def _kill(self):
+        import pymysql
+
+        if self._side_conn is None:
+            self._side_conn = pymysql.connect(**self._params)
+        with self._side_conn.cursor() as cursor:
+            cursor.execute(f'KILL QUERY {self.conn.thread_id()}')
+
+    def _set_socket_timeout(self, seconds):
+        # pymysql每次读写套接字前都会使用这两个超时设置
+        self.conn._read_timeout = seconds
+        self.conn._write_timeout = seconds
+
+    def _recover(self):
+        '''
+        超时后确保连接可继续使用，读写超时断开的连接会重新连接
+        '''
+        self.conn.ping(reconnect=True)
+
+    def _timed_out(self, sql):
+        shape = statement_shape(sql)
+        self.timeout_stats[shape] = self.timeout_stats.get(shape, 0) + 1
+
+    @contextmanager
+    def transaction(self):
+        '''
+        事务上下文，退出时提交，出现异常时回滚；嵌套时并入外层事务
+        提交后依次调用on_commit()登记的函数
+        '''
+        if self.in_transaction:
+            yield self
+            return
+
+        self._begin()
+        self.in_transaction = True
+        try:
+            yield self
+            self.conn.commit()
+        except BaseException:
+            self._callbacks = []
+            self.conn.rollback()
+            raise
+        finally:
+            self.in_transaction = False
+
+        callbacks, self._callbacks = self._callbacks, []
+        for func in callbacks:
+            func()
+
+    def on_commit(self, func):
+        '''
+        当前事务提交成功后调用func，回滚时丢弃；不在事务中时立即调用
+        '''
+        if not self.in_transaction:
+            func()
+        elif func not in self._callbacks:
+            self._callbacks.append(func)
+
+    def run(self, func, retries=5, delay=0.05, max_delay=2.0):
+        '''
+        在事务中执行func，遇到死锁、锁等待超时时回滚并重新执行整个事务，
+        每次重试前等待随机抖动的指数退避时间；已在事务中时由外层事务负责重试
+        :param func: 无参数函数，其中执行的语句属于同一事务
+        :param int retries: 最多重试次数
+        :param float delay: 首次重试的最长等待秒数，之后每次加倍
+        :param float max_delay: 最长等待秒数
+        :return: func的返回值
+        '''
+        if self.in_transaction:
+            return func()
+
+        for i in range(retries + 1):
+            try:
+                with self.transaction():
+                    return func()
+            except Exception as e:
+                reason = self.dialect.retry_reason(e)
+                if not reason:
+                    raise
+                self.retry_stats[reason] += 1
+                if i == retries:
+                    self.retry_stats['failures'] += 1
+                    raise
+                self.retry_stats['retries'] += 1
+                time.sleep(random.uniform(0, min(max_delay, delay * 2 ** i)))
+
+    def run_batch(self, func, batch, retries=3, **kw):
+        '''
+        以事务写入一批数据，多次冲突仍失败时将该批拆成两半分别写入
+        :param func: 写入函数func(batch)
+        :param list batch: 一批数据
+        :return: 各次func返回值之和
+        '''
+        try:
+            return self.run(lambda: func(batch), retries, **kw)
+        except Exception as e:
+            if len(batch) < 2 or self.in_transaction or not self.dialect.retry_reason(e):
+                raise
+
+        self.retry_stats['splits'] += 1
+        half = len(batch) // 2
+        return self.run_batch(func, batch[:half], retries, **kw) + \
+            self.run_batch(func, batch[half:], retries, **kw)
+
+    def _begin(self):
+        self.conn.begin()
+
+    #----------------------------
+    # 批量语句
+    #----------------------------
+    @contextmanager
+    def pipeline(self):
+        '''
+        在上下文中收集语句，退出时一次发送并在一个事务中执行，上下文中出现异常时不执行
+        批量语句有自己的事务，已在事务中时抛出PipelineTransactionError
+        使用:
+            with Connector.pipeline() as p:
+                ret = model.create(vals, pipeline=p)
+            ret.lastrowid
+        '''
+        pipeline = Pipeline(self)
+        yield pipeline
+        pipeline.execute()
+
+    def _run_pipeline(self, pipeline):
+        '''
+        在开启多语句的独立连接上，将所有语句与START TRANSACTION拼接为一个请求发送，
+        没有检查函数时COMMIT也一并发送，只需一次往返
+        '''
+        import pymysql
+
+        if self._multi_conn is None:
+            self._multi_conn = pymysql.connect(client_flag=pymysql.constants.CLIENT.MULTI_STATEMENTS,
+                                               **self._params)
+        conn = self._multi_conn
+        cursor = conn.cursor(cursor=pymysql.cursors.DictCursor)
+        commit = not pipeline.has_checks()
+        sqls = ['START TRANSACTION'] + [cursor.mogrify(sql, args) for sql, args, _ in pipeline.statements]
+        if commit:
+            sqls.append('COMMIT')
+
+        done = 0
+        try:
+            cursor.execute(';\n'.join(sqls))
+            for _, _, result in pipeline.statements:
+                cursor.nextset()
+                result.fill(cursor)
+                done += 1
+            if commit:
+                cursor.nextset()
+            else:
+                pipeline.check()
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            if done < len(pipeline.statements):
+                raise PipelineError(done, pipeline.statements[done][0], e) from e
+            raise
+        finally:
+            cursor.close()
+
+    def tables(self):
+        '''
+        获取当前数据库的所有表名
+        '''
+        self.cursor.execute(self.dialect.tables_sql())
+        return [list(row.values())[0] for row in self.cursor.fetchall()]
+
+    def stream(self, sql: str, args=None, size=1000, timeout=None):
+        '''
+        使用服务端游标分批读取查询结果，每批为元组列表，不创建字典
+        游标未读取完之前，该连接不能执行其他语句
+        超时从执行开始计算，包括调用方处理各批数据的时间，到期时取消语句并抛出QueryTimeout
+        :param str sql: sql语句
+        :param args: sql语句参数
+        :param int size: 每批行数
+        :param float timeout: 超时秒数，与deadline()取较早者
+        :return:
+        '''
+        import pymysql
+
+        with self._timed(sql, timeout) as sql:
+            cursor = self.conn.cursor(cursor=pymysql.cursors.SSCursor)
+            try:
+                cursor.execute(sql, args)
+                while True:
+                    rows = cursor.fetchmany(size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+
     def close(self):
         '''
         关闭数据库连接
@@ -28,4 +351,173 @@ class Connector(object):
         '''
 
         self.cursor.close()
-        self.conn.close()
\ No newline at end of file
+        self.conn.close()
+        for conn in (self._side_conn, self._multi_conn):
+            if conn is not None:
+                conn.close()
+
+class PipelineResult(object):
+    '''
+    批量语句中单条语句的执行结果，批量语句执行后填入
+
+    :param str sql: sql语句
+    :param int rowcount: 影响行数
+    :param int lastrowid: 插入的ID
+    :param list rows: 查询结果
+    '''
+    def __init__(self, sql, check=None):
+        self.sql = sql
+        self.check = check
+        self.rowcount = None
+        self.lastrowid = None
+        self.rows = None
+
+    def fill(self, cursor):
+        self.rowcount = cursor.rowcount
+        self.lastrowid = cursor.lastrowid
+        self.rows = cursor.fetchall() if cursor.description else None
+
+class Pipeline(object):
+    '''
+    批量语句：收集多个模型的语句，由连接器一次发送执行
+    '''
+    def __init__(self, connector):
+        self.connector = connector
+        self.statements = []
+        self._callbacks = []
+
+    def __len__(self):
+        return len(self.statements)
+
+    def add(self, sql, args=None, check=None):
+        '''
+        加入一条语句
+        :param check: 提交前的检查函数check(result)，抛出异常时整个事务回滚
+        :return: PipelineResult
+        '''
+        result = PipelineResult(sql, check)
+        self.statements.append((sql, args, result))
+        return result
+
+    def on_commit(self, func):
+        '''
+        提交成功后调用func
+        '''
+        if func not in self._callbacks:
+            self._callbacks.append(func)
+
+    def has_checks(self):
+        return any(result.check for _, _, result in self.statements)
+
+    def check(self):
+        for _, _, result in self.statements:
+            if result.check:
+                result.check(result)
+
+    def execute(self):
+        '''
+        执行所有语句，任一语句失败时全部回滚并抛出PipelineError
+        :return: PipelineResult列表
+        '''
+        # MySQL的批量语句在独立连接上提交，不属于外层事务，外层回滚时无法撤销
+        if self.connector.in_transaction:
+            raise PipelineTransactionError()
+        if self.statements:
+            self.connector._run_pipeline(self)
+            for func in self._callbacks:
+                func()
+
+        return [result for _, _, result in self.statements]
+
+_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b")
+_VALUES = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+def statement_shape(sql):
+    '''
+    将语句中的常量替换为?，用于统计同一类语句
+    '''
+    shape = _VALUES.sub('(...)', _LITERAL.sub('?', sql))
+    return ' '.join(shape.split())
+
+def _retry_stats():
+    '''
+    重试统计：deadlock死锁次数、lock_timeout锁等待超时次数、retries重试次数、
+    failures重试后仍失败次数、splits拆分批次次数
+    '''
+    return {'deadlock': 0, 'lock_timeout': 0, 'retries': 0, 'failures': 0, 'splits': 0}
+
+def _dict_row(cursor, row):
+    return {d[0]: v for d, v in zip(cursor.description, row)}
+
+sqlite3.register_adapter(datetime, lambda v: v.isoformat(' '))
+sqlite3.register_adapter(date, lambda v: v.isoformat())
+sqlite3.register_converter('DATETIME', lambda v: datetime.fromisoformat(v.decode()))
+sqlite3.register_converter('DATE', lambda v: date.fromisoformat(v.decode()))
+
+class SQLiteConnector(Connector):
+    """
+        Python与SQLite连接器，接口与Connector一致，用于单元测试、基准测试和离线使用
+    """
+    dialect = dialects.sqlite
+
+    def __init__(self, path=':memory:'):
+        self.name = f'sqlite:///{path}'
+        # isolation_level=None时由transaction()显式开启事务
+        conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA foreign_keys=ON')
+
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.cursor.row_factory = _dict_row
+        self._init_state()
+
+    def _begin(self):
+        # 立即获取写锁，避免读锁升级为写锁时死锁
+        self.conn.execute('BEGIN IMMEDIATE')
+
+    def execute(self, sql: str, args=None, timeout=None):
+        sql = self.dialect.format_sql(sql) if args is not None else sql
+        self._call(sql, timeout, lambda sql: self.cursor.execute(sql, args or ()))
+        return self.cursor.rowcount
+
+    def executemany(self, sql: str, args, timeout=None):
+        self._call(self.dialect.format_sql(sql), timeout, lambda sql: self.cursor.executemany(sql, args))
+        return self.cursor.rowcount
+
+    def _kill(self):
+        self.conn.interrupt()
+
+    def _run_pipeline(self, pipeline):
+        '''
+        SQLite在进程内执行，没有网络往返，在一个事务中依次执行
+        '''
+        done = 0
+        with self.transaction():
+            try:
+                for sql, args, result in pipeline.statements:
+                    self.cursor.execute(self.dialect.format_sql(sql) if args is not None else sql, args or ())
+                    result.fill(self.cursor)
+                    done += 1
+            except Exception as e:
+                raise PipelineError(done, pipeline.statements[done][0], e) from e
+            pipeline.check()
+
+    def _set_socket_timeout(self, seconds):
+        pass
+
+    def _recover(self):
+        pass
+
+    def stream(self, sql: str, args=None, size=1000, timeout=None):
+        with self._timed(self.dialect.format_sql(sql) if args is not None else sql, timeout) as sql:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(sql, args or ())
+                while True:
+                    rows = cursor.fetchmany(size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
@@ -0,0 +1,229 @@
+'''
+模型数据的流式导入导出，内存占用与文件大小无关
+'''
+
+import csv
+import json
+import os
+import time
+import inspect
+import tempfile
+import itertools
+from datetime import date, datetime
+
+from equipsedit import fields
+
+FORMATS = ('csv', 'jsonl')
+
+# LOAD DATA LOCAL INFILE不可用时的错误码：服务端/客户端禁用本地文件
+_LOCAL_INFILE_ERRORS = (1148, 2068, 3948)
+# 每批最多记录的警告条数
+MAX_WARNINGS = 20
+
+class Progress(object):
+    '''
+    导入导出进度与吞吐量统计
+
+    :param str title: 输出标题
+    :param callback: 进度回调函数callback(rows, seconds)，为空时打印进度
+    '''
+    def __init__(self, title, callback=None):
+        self.title = title
+        self.callback = callback
+        self.rows = 0
+        self.skipped = 0
+        self.warnings = []
+        self.start = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.start
+
+    def add(self, rows, skipped=0):
+        '''
+        :param int rows: 实际写入或读取的行数
+        :param int skipped: 未写入的行数
+        '''
+        self.rows += rows
+        self.skipped += skipped
+        if self.callback:
+            self.callback(self.rows, self.seconds)
+        else:
+            skipped = f'，跳过{self.skipped}行' if self.skipped else ''
+            print(f'{self.title}：{self.rows}行{skipped}，{self.rows / (self.seconds or 1e-9):.0f}行/秒')
+
+    def result(self):
+        return {'rows': self.rows, 'skipped': self.skipped, 'warnings': self.warnings,
+                'seconds': self.seconds, 'rows_per_second': self.rows / (self.seconds or 1e-9)}
+
+def read_file(path, format='csv'):
+    '''
+    逐行读取文件，返回字典的生成器
+    :param str path: 文件路径
+    :param str format: csv（首行为字段名）或jsonl（每行一个JSON对象）
+    '''
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            yield from csv.DictReader(f)
+        elif format == 'jsonl':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ValueError(f'不支持的文件格式{format}，可选{FORMATS}')
+
+def convert_rows(_fields, rows):
+    '''
+    按字段定义校验并转换每一行，缺失的字段使用默认值，编码存储的字段转换为编码
+    :param list _fields: 导入的字段
+    :param rows: 字典的迭代器
+    :return: 元组的生成器，顺序与_fields一致
+    '''
+    defaults = []
+    for field in _fields:
+        v = field.default
+        defaults.append((v, inspect.isfunction(v)))
+
+    for row in rows:
+        values = []
+        for field, (default, is_func) in zip(_fields, defaults):
+            if field.name in row:
+                values.append(field.convert_to_column(row[field.name]))
+            else:
+                values.append(field.encode(default(field) if is_func else default))
+        yield tuple(values)
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _infile_value(v):
+    '''
+    转换为LOAD DATA默认格式：制表符分隔，\\N为NULL，反斜杠转义
+    '''
+    if v is None:
+        return '\\N'
+    if isinstance(v, (date, datetime)):
+        v = v.isoformat(' ') if isinstance(v, datetime) else v.isoformat()
+    return str(v).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+def _load_chunk(connector, table, names, chunk, warnings):
+    '''
+    将一批数据写入临时文件，通过LOAD DATA LOCAL INFILE导入
+    LOCAL模式下重复键的行会被跳过、数据错误降级为警告而不是报错，警告由SHOW WARNINGS读取
+    :param list warnings: 追加本批的警告
+    :return: 实际导入的行数
+    '''
+    fd, path = tempfile.mkstemp(suffix='.tsv')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            for values in chunk:
+                f.write('\t'.join(_infile_value(v) for v in values) + '\n')
+
+        count = connector.execute(
+            f'LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 '
+            f'FIELDS TERMINATED BY "\\t" LINES TERMINATED BY "\\n" ({",".join(names)})',
+            (path,))
+        connector.execute(f'SHOW WARNINGS LIMIT {MAX_WARNINGS}')
+        warnings.extend(f'{row["Level"]} {row["Code"]}: {row["Message"]}' for row in connector.cursor.fetchall())
+        return count
+    finally:
+        os.remove(path)
+
+def _insert_chunk(connector, table, names, chunk, warnings):
+    return connector.executemany(
+        f'INSERT INTO {table} ({",".join(names)}) VALUES ({",".join(["%s"] * len(names))})', chunk)
+
+def import_file(model, connector, path, format='csv', chunk_size=5000, progress=None, on_chunk=None):
+    '''
+    流式导入文件，优先使用LOAD DATA LOCAL INFILE，数据库不支持或未开启时改为分批多行INSERT
+    两种方式都按数据库返回的影响行数统计导入行数：LOAD DATA跳过的重复键行计入skipped，
+    降级的数据错误记录在warnings中（每批最多MAX_WARNINGS条）；INSERT遇到重复键或数据错误时报错
+    :param model: 导入的模型
+    :param connector: 数据库连接器
+    :param str path: 文件路径
+    :param str format: 文件格式，见FORMATS
+    :param int chunk_size: 每批行数
+    :param progress: 进度回调函数progress(rows, seconds)
+    :param on_chunk: 每批提交后调用on_chunk(names, chunk)，chunk为与names顺序一致的元组列表
+    :return: {'rows': 导入行数, 'skipped': 跳过行数, 'warnings': 警告, 'seconds': 耗时,
+              'rows_per_second': 吞吐量}
+    '''
+    stats = Progress(f'导入{model._name}', progress)
+    import_rows(model, connector, read_file(path, format), chunk_size, stats, on_chunk)
+    return stats.result()
+
+def import_rows(model, connector, rows, chunk_size, stats, on_chunk=None):
+    '''
+    按字段定义转换后分批写入，见import_file
+    :param rows: 字典的迭代器，各行的字段需一致
+    :param Progress stats: 累加导入行数的进度统计
+    '''
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+
+    # 自增主键只有在文件中给出时才导入
+    _fields = [field for field in model._column_fields()
+               if not field.auto_increment or field.name in first]
+    names = [field.name for field in _fields]
+    table = model._get_name()
+
+    for chunk in chunked(convert_rows(_fields, itertools.chain([first], rows)), chunk_size):
+        count = None
+        if connector.local_infile:
+            try:
+                count = connector.run_batch(lambda batch: _load_chunk(connector, table, names, batch, stats.warnings),
+                                            chunk)
+            except Exception as e:
+                # 按错误码判断，不依赖MySQL驱动的异常类型
+                if not e.args or e.args[0] not in _LOCAL_INFILE_ERRORS:
+                    raise
+                connector.local_infile = False
+        if count is None:
+            count = connector.run_batch(lambda batch: _insert_chunk(connector, table, names, batch, stats.warnings),
+                                        chunk)
+        stats.add(count, len(chunk) - count)
+        if on_chunk:
+            on_chunk(names, chunk)
+
+def _json_default(v):
+    return v.isoformat(' ') if isinstance(v, datetime) else str(v)
+
+def export_file(query, connector, path, format='csv', batch_size=5000, progress=None):
+    '''
+    使用服务端游标将查询结果分批写入文件
+    :param query: search()返回的Query对象
+    :param connector: 数据库连接器
+    :param str path: 文件路径
+    :param str format: 文件格式，见FORMATS
+    :param int batch_size: 每批行数
+    :param progress: 进度回调函数progress(rows, seconds)
+    :return: {'rows': 行数, 'seconds': 耗时, 'rows_per_second': 吞吐量}
+    '''
+    if format not in FORMATS:
+        raise ValueError(f'不支持的文件格式{format}，可选{FORMATS}')
+
+    _fields = query.model._column_fields()
+    names = [field.name for field in _fields]
+    stats = Progress(f'导出{query.model._name}', progress)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if format == 'csv':
+            writer.writerow(names)
+
+        for batch in connector.stream(query._select_sql(names), size=batch_size, timeout=query.time_limit):
+            batch = fields.decode_rows(_fields, batch)
+            if format == 'csv':
+                writer.writerows(batch)
+            else:
+                f.writelines(json.dumps(dict(zip(names, values)), ensure_ascii=False,
+                                        default=_json_default) + '\n' for values in batch)
+            stats.add(len(batch))
+
+    return stats.result()
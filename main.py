@@ -1,4 +1,4 @@
-from equipsedit import models
+from equipsedit import loader
 from equipsedit.models import Q
 from equipsedit import _ROOT_DIR
 
@@ -10,15 +10,9 @@ import inspect
 a = 'equipsedit.apps.users.users'
 
 def main():
-    _models = []
-    model = object()
-    for cls in models.Model.__subclasses__():
-        c = cls()
-
-        model = c if c._name == 'ir.model' else model
-        if c._init and not c._has_created():
-            c.create_table()
-            _models.append(c)
+    # 只导入尚未建表的模型所在的模块，见loader.create_tables
+    _models = loader.create_tables()
+    model = loader.get('ir.model')()
 
     for cls in _models:
         model.create({
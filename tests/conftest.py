@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+# 导入equipsedit前指定数据库和缓存目录：测试使用内存SQLite，不需要MySQL和pymysql
+os.environ['EQUIPSEDIT_DB'] = 'sqlite:///:memory:'
+os.environ.pop('EQUIPSEDIT_SHARDS', None)
+os.environ.setdefault('EQUIPSEDIT_MODEL_CACHE', tempfile.mkdtemp(prefix='equipsedit_test_'))
+
+import pytest
+
+from equipsedit import models, sql_db, compute, changes
+
+@pytest.fixture(autouse=True)
+def db(monkeypatch):
+    '''
+    每个测试使用新的内存数据库
+    '''
+    connector = sql_db.connect('sqlite:///:memory:')
+    monkeypatch.setattr(models, 'Connector', connector)
+    yield connector
+    compute._dirty.clear()
+    compute._dirty_via.clear()
+    connector.close()
+
+@pytest.fixture
+def events():
+    '''
+    收集发布的变更事件
+    '''
+    ret = []
+
+    class Sink(object):
+        emit = ret.append
+
+    changes.feed.add_sink(Sink)
+    yield ret
+    changes.feed.remove_sink(Sink)
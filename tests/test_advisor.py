@@ -0,0 +1,81 @@
+import pytest
+
+from equipsedit import models, fields, advisor, dialects
+from equipsedit.errors import FieldValueError
+
+class Hero(models.Model):
+    _name = 'test.hero'
+
+    name = fields.Char('名称')
+    level = fields.Int('等级')
+    job = fields.Selection([('warrior', '战士'), ('mage', '法师')], default='warrior')
+    rank = fields.Selection([(1, '一阶'), (2, '二阶')])
+
+@pytest.fixture
+def hero():
+    model = Hero()
+    model.get_fields()
+    return model
+
+def test_selection_codec(hero):
+    job = hero.job
+    assert job.codec == ('warrior', 'mage') and job._type == 'TINYINT'
+    assert [job.encode(key) for key in job.codec] == [0, 1]
+    assert [job.decode(job.encode(key)) for key in job.codec] == ['warrior', 'mage']
+    assert job.encode(None) is None and job.decode(None) is None
+    assert job.convert_to_column('mage') == 1
+    with pytest.raises(FieldValueError):
+        job.encode('thief')
+    with pytest.raises(FieldValueError):
+        job.convert_to_column('thief')
+    # 整数选项直接存储
+    assert hero.rank.codec is None and hero.rank.encode(2) == 2 and hero.rank.convert_to_column('2') == 2
+
+def test_selection_round_trip(hero, db):
+    hero.create_table()
+    hero.create({'name': 'a', 'job': 'mage', 'rank': 2})
+    hero.upsert_multi([{'name': 'b'}])
+
+    db.execute('SELECT job FROM test_hero ORDER BY id')
+    assert [row['job'] for row in db.cursor.fetchall()] == [1, 0]
+    assert [(row['job'], row['rank']) for row in hero.search()] == [('mage', 2), ('warrior', None)]
+    assert [row['name'] for row in hero.search(job='mage')] == ['a']
+    assert [row['name'] for row in hero.search(job__in=['warrior'])] == ['b']
+    assert hero.search(job='mage').to_columns()['job'].values[0] == 1
+
+def test_advise(hero, db):
+    hero.create_table()
+    hero.upsert_multi([{'name': f'n{i}', 'level': i % 50} for i in range(100)])
+    # 抽样之外的行决定建议的宽度
+    hero.create({'name': 'x' * 20, 'level': 1000})
+
+    ret = hero.advise(sample=10)
+    assert (ret['table'], ret['rows'], ret['sampled']) == ('test_hero', 101, 10)
+    suggestions = {s['field']: s for s in ret['suggestions']}
+    assert suggestions['name']['proposed'] == 'VARCHAR(32)' and suggestions['name']['max_length'] == 20
+    assert suggestions['level']['proposed'] == 'SMALLINT'
+    # SQLite不支持修改列类型
+    assert all(s['sql'] == [] and s['invalid'] == 0 for s in ret['suggestions'])
+    assert ret['bytes_saved'] == sum(s['bytes_saved'] for s in ret['suggestions']) > 0
+    assert 'name: VARCHAR(128) -> VARCHAR(32)' in advisor.report([ret])
+
+def test_advise_selection_migration(hero, db):
+    # 旧版本的Selection列为VARCHAR，存储选项文字
+    db.execute('CREATE TABLE test_hero (id INTEGER PRIMARY KEY AUTOINCREMENT, create_time DATETIME, '
+               'write_time DATETIME, name VARCHAR(128), level INT, job VARCHAR(16), rank TINYINT)')
+    db.executemany('INSERT INTO test_hero (name, job) VALUES (%s, %s)', [('a', 'warrior'), ('b', 'thief')])
+
+    ret = hero.advise()
+    job = next(s for s in ret['suggestions'] if s['field'] == 'job')
+    assert (job['proposed'], job['invalid'], job['sql']) == ('TINYINT', 1, [])
+    assert '1行不在选项中' in advisor.report([ret])
+
+def test_suggest_mysql(hero):
+    job = advisor._suggest(hero.job, 'varchar(16)', {'invalid': 0}, dialects.mysql, 'test_hero')
+    assert job['invalid'] == 0
+    assert job['sql'][0].startswith("UPDATE test_hero SET job=CASE job WHEN 'warrior' THEN '0'")
+    assert job['sql'][1].startswith('ALTER TABLE test_hero MODIFY')
+
+    # 有不在选项中的值时不给出语句
+    job = advisor._suggest(hero.job, 'varchar(16)', {'invalid': 3}, dialects.mysql, 'test_hero')
+    assert (job['invalid'], job['sql']) == (3, [])
@@ -0,0 +1,97 @@
+import os
+import time
+
+import pytest
+
+from equipsedit import models, fields, cache
+
+class Cached(models.Model):
+    _name = 'test.cached'
+    _cache = True
+
+    name = fields.Char('名称')
+
+@pytest.fixture
+def result_cache(tmp_path, monkeypatch):
+    ret = cache.ResultCache(str(tmp_path / 'cache'), ttl=60, max_entries=10)
+    monkeypatch.setattr(models, 'result_cache', ret)
+    return ret
+
+def test_ttl(result_cache, monkeypatch):
+    key = result_cache.key('t', 'SELECT 1')
+    result_cache.set(key, [1])
+    assert result_cache.get(key) == [1]
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert result_cache.get(key) is cache._MISS
+
+def test_lru_eviction(result_cache):
+    keys = [result_cache.key('t', f'SELECT {i}') for i in range(10)]
+    for key in keys:
+        result_cache.set(key, key)
+    # 按写入顺序设置访问时间，再访问第一条，使其成为最近访问的缓存
+    now = time.time()
+    for i, key in enumerate(keys):
+        os.utime(result_cache._entry_file(key), (now - 100 + i, now - 100 + i))
+    assert result_cache.get(keys[0]) == keys[0]
+
+    # 超过max_entries时淘汰到90%，最久未访问的先淘汰
+    result_cache.set(result_cache.key('t', 'SELECT 10'), 10)
+    assert len(os.listdir(os.path.join(result_cache.path, 'entries'))) == 9
+    assert result_cache.get(keys[0]) == keys[0]
+    assert result_cache.get(keys[1]) is cache._MISS
+    assert result_cache.get(keys[2]) is cache._MISS
+    assert result_cache.get(keys[3]) == keys[3]
+
+def test_bump_and_hit_ratio(result_cache):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return len(calls)
+
+    assert result_cache.fetch('m', 't', 'SELECT 1', None, fetch, db='a') == 1
+    assert result_cache.fetch('m', 't', 'SELECT 1', None, fetch, db='a') == 1
+    assert result_cache.hit_ratio('m') == 0.5
+
+    # 其他数据库中同名表的版本号不受影响
+    result_cache.bump('t', 'b')
+    assert result_cache.fetch('m', 't', 'SELECT 1', None, fetch, db='a') == 1
+    result_cache.bump('t', 'a')
+    assert result_cache.fetch('m', 't', 'SELECT 1', None, fetch, db='a') == 2
+    assert result_cache.hit_ratio('m') == 0.5
+    assert result_cache.hit_ratio() == 0.5
+    assert result_cache.hit_ratio('other') == 0.0
+
+def test_bump_after_commit(result_cache, db):
+    model = Cached()
+    model.create_table()
+    assert list(model.search()) == []
+    version = result_cache.version('test_cached', db.name)
+
+    with pytest.raises(ZeroDivisionError):
+        with db.transaction():
+            model.create({'name': 'a'})
+            1 / 0
+    # 回滚时不更新版本号
+    assert result_cache.version('test_cached', db.name) == version
+
+    with db.transaction():
+        model.create({'name': 'b'})
+        assert result_cache.version('test_cached', db.name) == version
+    assert result_cache.version('test_cached', db.name) != version
+    assert [row['name'] for row in model.search()] == ['b']
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='按POSIX权限检查')
+def test_private_dir(tmp_path):
+    path = str(tmp_path / 'private')
+    cache.private_dir(path)
+    assert os.stat(path).st_mode & 0o777 == 0o700
+
+    # 其他用户可写的目录中可能被放入缓存文件，拒绝使用
+    os.chmod(path, 0o777)
+    with pytest.raises(PermissionError):
+        cache.private_dir(path)
+    with pytest.raises(PermissionError):
+        cache.ResultCache(path)
@@ -0,0 +1,69 @@
+import pytest
+
+from equipsedit import models, fields, compute
+
+class Cate(models.Model):
+    _name = 'test.cate'
+
+    name = fields.Char('名称')
+
+class Player(models.Model):
+    _name = 'test.player'
+
+    cate = fields.Many2one(Cate)
+    source = fields.Float('分数')
+    label = fields.Char('标签', compute='_compute_label', depends=('source', 'cate.name'))
+
+    def _compute_label(self, records):
+        return [f'{record["cate.name"]}:{record["source"]:g}' for record in records]
+
+def _labels(db):
+    db.execute('SELECT id, label FROM test_player ORDER BY id')
+    return [row['label'] for row in db.cursor.fetchall()]
+
+def _setup():
+    cate, player = Cate(), Player()
+    cate.create_table()
+    player.create_table()
+    return cate, player
+
+def test_compute_on_write(db):
+    cate, player = _setup()
+    cid = cate.create({'name': 'a'})
+    id = player.create({'cate': cid, 'source': 1})
+    player.create({'cate': cid, 'source': 2})
+    # 写入提交后立即重算，不需要先查询
+    assert _labels(db) == ['a:1', 'a:2']
+
+    player.update(id, {'source': 5})
+    assert _labels(db) == ['a:5', 'a:2']
+
+    # 经过Many2one的依赖：修改分类名称时重算引用它的记录
+    cate.update(cid, {'name': 'b'})
+    assert _labels(db) == ['b:5', 'b:2']
+
+def test_compute_in_transaction(db):
+    cate, player = _setup()
+    cid = cate.create({'name': 'a'})
+    id = player.create({'cate': cid, 'source': 1})
+
+    with db.transaction():
+        player.upsert_multi([{'id': id, 'source': 3}])
+    # 事务中的写入在提交后重算
+    assert _labels(db) == ['a:3']
+
+    with pytest.raises(ZeroDivisionError):
+        with db.transaction():
+            player.update(id, {'source': 4})
+            1 / 0
+    assert _labels(db) == ['a:3']
+    assert not compute.has_dirty()
+
+def test_recompute(db):
+    cate, player = _setup()
+    cid = cate.create({'name': 'a'})
+    player.create({'cate': cid, 'source': 1})
+    db.execute('UPDATE test_player SET label=NULL')
+
+    assert player.recompute() == 1
+    assert _labels(db) == ['a:1']
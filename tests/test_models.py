@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from equipsedit import models, fields
+from equipsedit.errors import ConcurrencyError, PipelineError, PipelineTransactionError
+
+class Item(models.Model):
+    _name = 'test.item'
+    _version_field = 'version'
+
+    name = fields.Char('名称', unique=True)
+    count = fields.Int('数量', default=0)
+    version = fields.Int(default=1, null=False)
+    state = fields.Selection([('draft', '草稿'), ('done', '完成')], default='draft')
+
+class Job(models.Model):
+    _name = 'test.job'
+    _claim_field = 'state'
+
+    state = fields.Selection([('pending', '待处理'), ('claimed', '处理中'), ('done', '完成')],
+                             default='pending', index=True)
+
+@pytest.fixture
+def item():
+    model = Item()
+    model.create_table()
+    return model
+
+@pytest.fixture
+def job():
+    model = Job()
+    model.create_table()
+    return model
+
+def test_create_and_search(item):
+    id = item.create({'name': 'a', 'count': 1})
+    item.create({'name': 'b', 'count': 5})
+
+    rows = list(item.search(id=id))
+    assert len(rows) == 1
+    assert rows[0]['name'] == 'a'
+    # 编码存储的Selection读取时解码
+    assert rows[0]['state'] == 'draft'
+    assert item.search(count__gte=2).count() == 1
+    assert [row['name'] for row in item.search(state='draft').order_by('count DESC')] == ['b', 'a']
+
+def test_update_with_version(item):
+    id = item.create({'name': 'a'})
+
+    assert item.update(id, {'count': 3, 'state': 'done'}, version=1) == 1
+    row = list(item.search(id=id))[0]
+    assert (row['count'], row['state'], row['version']) == (3, 'done', 2)
+
+    with pytest.raises(ConcurrencyError):
+        item.update(id, {'count': 4}, version=1)
+
+def test_upsert_multi(item):
+    item.upsert_multi([{'name': 'a', 'count': 1}, {'name': 'b', 'count': 2}], conflict_fields=('name',))
+
+    ret = item.upsert_multi([{'name': 'a', 'count': 10}, {'name': 'c', 'count': 3}], conflict_fields=('name',))
+    assert ret == {'inserted': 1, 'updated': 1}
+    assert {row['name']: row['count'] for row in item.search()} == {'a': 10, 'b': 2, 'c': 3}
+
+def test_upsert_counts(item):
+    # 同一批中重复的键只有第一行是插入
+    assert item.upsert_multi([{'name': 'a'}, {'name': 'a'}], conflict_fields=('name',)) == \
+        {'inserted': 1, 'updated': 1}
+    # 同一秒内重复写入相同数据，行未修改也计为更新
+    assert item.upsert_multi([{'name': 'a'}, {'name': 'b'}], conflict_fields=('name',)) == \
+        {'inserted': 1, 'updated': 1}
+    assert item.upsert_multi([{'name': 'a'}, {'name': 'b'}], conflict_fields=('name',)) == \
+        {'inserted': 0, 'updated': 2}
+    # NULL不会与其他行冲突
+    assert item.upsert_multi([{'name': None}, {'name': None}], conflict_fields=('name',)) == \
+        {'inserted': 2, 'updated': 0}
+    assert item.search().count() == 4
+
+def test_upsert_insert_ids(job, events):
+    job.upsert_multi([{'state': 'pending'} for _ in range(5)], chunk_size=2)
+
+    # 没有主键和冲突字段时，变更事件给出新插入的自增ID
+    ids = [row['id'] for row in job.search()]
+    assert [id for change in events for id in change.ids] == ids
+
+def test_claim(job):
+    job.upsert_multi({'state': 'pending'} for _ in range(5))
+
+    first = [row['id'] for row in job.claim(limit=3)]
+    second = [row['id'] for row in job.claim(limit=3)]
+    assert len(first) == 3 and len(second) == 2
+    assert not set(first) & set(second)
+    assert list(job.claim()) == []
+
+    job.mark_done(first)
+    job.release(second)
+    assert job.search(state='done').count() == 3
+    assert job.search(state='pending').count() == 2
+
+def test_reclaim_stale(job, db):
+    job.upsert_multi({'state': 'pending'} for _ in range(3))
+    ids = [row['id'] for row in job.claim()]
+    assert job.reclaim_stale(60) == 0
+
+    db.execute('UPDATE test_job SET write_time=%s WHERE id=%s', (datetime.now() - timedelta(seconds=120), ids[0]))
+    assert job.reclaim_stale(60) == 1
+    # 已退回的任务不能再被原worker标记完成或退回
+    assert job.mark_done(ids) == 2
+    assert job.release([ids[0]]) == 0
+    assert [row['id'] for row in job.claim()] == [ids[0]]
+    assert job.search(state='done').count() == 2
+
+def test_pipeline(item, db):
+    with db.pipeline() as p:
+        first = item.create({'name': 'a'}, pipeline=p)
+        item.create({'name': 'b'}, pipeline=p)
+    assert first.rowcount == 1
+    assert item.search().count() == 2
+
+    # 任一语句失败时全部回滚
+    with pytest.raises(PipelineError):
+        with db.pipeline() as p:
+            item.create({'name': 'c'}, pipeline=p)
+            item.create({'name': 'a'}, pipeline=p)
+    assert item.search().count() == 2
+
+def test_pipeline_in_transaction(item, db):
+    with pytest.raises(PipelineTransactionError):
+        with db.transaction():
+            with db.pipeline() as p:
+                item.create({'name': 'a'}, pipeline=p)
+    assert item.search().count() == 0
+
+def test_to_columns(item):
+    item.upsert_multi([{'name': f'n{i}', 'count': i if i % 3 else None} for i in range(2500)], conflict_fields=('name',))
+
+    # 不预先COUNT，缓冲区按批翻倍扩容后截断到实际行数
+    cols = item.search(id__gt=100).to_columns(batch_size=300)
+    assert len(cols['count']) == len(cols['name']) == 2400
+    assert cols['count'].has_null
+    assert cols['name'].values[0] == 'n100'
+    assert sum(cols['count'].values) == sum(i for i in range(100, 2500) if i % 3)
+
+def test_update_table(db):
+    # 旧版本建的表没有索引
+    db.execute('CREATE TABLE test_item (id INTEGER PRIMARY KEY AUTOINCREMENT, create_time DATETIME, '
+               'write_time DATETIME, name VARCHAR(128), count INT, version INT NOT NULL, state TINYINT)')
+
+    sqls = Item().update_table()
+    assert any('write_time' in sql for sql in sqls)
+    db.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='test_item'")
+    assert 'test_item_write_time_index' in {row['name'] for row in db.cursor.fetchall()}
+    # 索引已存在时不再执行
+    assert Item().update_table() == []
+
+def test_publish_after_commit(item, db, events):
+    with pytest.raises(ZeroDivisionError):
+        with db.transaction():
+            item.create({'name': 'a'})
+            1 / 0
+    # 回滚的写入不发布变更事件
+    assert events == []
+    assert item.search().count() == 0
+
+    with db.transaction():
+        id = item.create({'name': 'b'})
+        assert events == []
+    assert [(change.op, change.ids) for change in events] == [('create', [id])]
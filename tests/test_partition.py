@@ -0,0 +1,114 @@
+from datetime import date, datetime
+
+import pytest
+
+from equipsedit import models, fields, dialects, partition
+from equipsedit.errors import FieldError
+
+class Log(models.Model):
+    _name = 'test.log'
+    _partition_by = ('range', 'create_time', 'month')
+
+    amount = fields.Int('数量')
+
+@pytest.fixture
+def log():
+    model = Log()
+    model.create_table()
+    return model
+
+def test_archive(log, events):
+    old = [log.create({'amount': i, 'create_time': datetime(2020, 1, 1)}) for i in range(3)]
+    new = log.create({'amount': 9})
+    del events[:]
+
+    ret = log.archive(datetime(2021, 1, 1))
+    assert ret == {'partitions': ['test_log_archive'], 'rows': 3}
+    assert [row['id'] for row in log.search()] == [new]
+    # 变更事件给出归档的记录ID
+    assert [(change.op, sorted(change.ids)) for change in events] == [('delete', old)]
+
+class Record(models.Model):
+    _name = 'test.record'
+    _partition_by = ('range', 'create_time', 'month')
+
+    level = fields.Int('等级')
+    profession = fields.Char('职业')
+
+class Note(models.Model):
+    _name = 'test.note'
+
+    text = fields.Char('内容', fulltext=True)
+
+class Fake(object):
+    '''
+    只返回分区信息的MySQL连接器
+    '''
+    dialect = dialects.mysql
+
+    def __init__(self, parts):
+        self.cursor = self
+        self.parts = parts
+
+    def execute(self, sql, args=None):
+        assert sql == self.dialect.partitions_sql()
+
+    def fetchall(self):
+        return [{'name': name, 'description': description} for name, description in self.parts]
+
+def test_definitions():
+    assert partition.Partition('range', 'create_time', 'month').definitions(date(2024, 11, 15), 3) == [
+        ('p202411', date(2024, 12, 1)), ('p202412', date(2025, 1, 1)), ('p202501', date(2025, 2, 1))]
+    assert partition.Partition('range', 'create_time', 'year').definitions(date(2024, 5, 1), 1) == [
+        ('p2024', date(2025, 1, 1))]
+    assert partition.Partition('range', 'level', 100).definitions(250, 2) == [('p200', 300), ('p300', 400)]
+
+def test_create_sql():
+    sql = partition.Partition('range', 'level', 100).create_sql(Record(), dialects.mysql, ahead=1)
+    assert sql == ' PARTITION BY RANGE COLUMNS(level) (PARTITION p0 VALUES LESS THAN (100),' \
+                  'PARTITION p100 VALUES LESS THAN (200),PARTITION pmax VALUES LESS THAN (MAXVALUE))'
+
+    sql = partition.Partition('list', 'profession', {'p1': ['战士', '法师']}).create_sql(Record(), dialects.mysql)
+    assert sql == " PARTITION BY LIST COLUMNS(profession) (PARTITION p1 VALUES IN ('战士','法师'))"
+
+    assert partition.Partition('hash', 'level', 4).create_sql(Record(), dialects.mysql) == \
+        ' PARTITION BY HASH(level) PARTITIONS 4'
+    assert partition.Partition('hash', 'profession', 4).create_sql(Record(), dialects.mysql) == \
+        ' PARTITION BY KEY(profession) PARTITIONS 4'
+
+    # 按月分区从当前月开始预建
+    sql = partition.Partition('range', 'create_time', 'month').create_sql(Record(), dialects.mysql, ahead=2)
+    assert sql.count('PARTITION p') == 4
+    assert f"PARTITION p{date.today():%Y%m} VALUES LESS THAN ('" in sql
+
+def test_check():
+    with pytest.raises(FieldError):
+        partition.Partition('range', 'level', 'month').check(Record())
+    with pytest.raises(FieldError):
+        partition.Partition('range', 'missing', 'month').check(Record())
+    partition.Partition('range', 'create_time', 'month').check(Record())
+    # MySQL分区表不支持全文索引
+    with pytest.raises(FieldError):
+        partition.Partition('range', 'create_time', 'month').check(Note())
+
+def test_prune():
+    model = Record()
+    connector = Fake([('p202411', "'2024-12-01'"), ('p202412', "'2025-01-01'"), ('pmax', 'MAXVALUE')])
+    prune = partition.Partition('range', 'create_time', 'month').prune
+
+    assert prune(model, connector, [('create_time__gte', datetime(2024, 12, 5))]) == ['p202412', 'pmax']
+    assert prune(model, connector, [('create_time__lt', datetime(2024, 12, 1))]) == ['p202411']
+    assert prune(model, connector, [('create_time__gte', datetime(2024, 11, 20)),
+                                    ('create_time__lt', datetime(2024, 12, 10))]) == ['p202411', 'p202412']
+    assert prune(model, connector, [('create_time', datetime(2026, 1, 1))]) == ['pmax']
+    # 条件未限定分区字段时不裁剪
+    assert prune(model, connector, [('level', 1)]) is None
+
+    connector = Fake([('p1', "'战士','法师'"), ('p2', "'刺客'")])
+    prune = partition.Partition('list', 'profession', {}).prune
+    assert prune(model, connector, [('profession__in', ['刺客'])]) == ['p2']
+    # 没有分区满足条件时只读取第一个分区
+    assert prune(model, connector, [('profession', '牧师')]) == ['p1']
+
+    connector = Fake([('p0', None), ('p1', None), ('p2', None)])
+    assert partition.Partition('hash', 'level', 3).prune(model, connector, [('level', 5)]) == ['p2']
@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+LOCKED = sqlite3.OperationalError('database is locked')
+
+def _setup(db):
+    db.execute('CREATE TABLE t (x INT)')
+
+def _rows(db):
+    db.execute('SELECT x FROM t ORDER BY x')
+    return [row['x'] for row in db.cursor.fetchall()]
+
+def test_run_retry(db):
+    _setup(db)
+    attempts = []
+
+    def func():
+        attempts.append(1)
+        db.execute('INSERT INTO t VALUES (%s)', (len(attempts),))
+        if len(attempts) < 3:
+            raise LOCKED
+        return 'ok'
+
+    assert db.run(func, delay=0) == 'ok'
+    # 失败的尝试已回滚，只留下最后一次写入
+    assert _rows(db) == [3]
+    assert db.retry_stats == {'deadlock': 0, 'lock_timeout': 2, 'retries': 2, 'failures': 0, 'splits': 0}
+
+def test_run_failure(db):
+    def locked():
+        raise LOCKED
+
+    with pytest.raises(sqlite3.OperationalError):
+        db.run(locked, retries=2, delay=0)
+    assert db.retry_stats['lock_timeout'] == 3
+    assert (db.retry_stats['retries'], db.retry_stats['failures']) == (2, 1)
+
+    # 不可重试的错误直接抛出
+    def broken():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        db.run(broken, delay=0)
+    assert db.retry_stats['retries'] == 2
+
+def test_run_in_transaction(db):
+    def locked():
+        raise LOCKED
+
+    # 已在事务中时由外层事务负责重试
+    with pytest.raises(sqlite3.OperationalError):
+        with db.transaction():
+            db.run(locked, delay=0)
+    assert db.retry_stats['lock_timeout'] == 0
+
+def test_run_batch_split(db):
+    _setup(db)
+    batches = []
+
+    def write(batch):
+        batches.append(list(batch))
+        # 多于2行的批次总是冲突
+        if len(batch) > 2:
+            raise LOCKED
+        db.executemany('INSERT INTO t VALUES (%s)', [(x,) for x in batch])
+        return len(batch)
+
+    assert db.run_batch(write, list(range(8)), retries=1, delay=0) == 8
+    assert _rows(db) == list(range(8))
+    # 8行拆成两个4行，再拆成四个2行
+    assert [batch for batch in batches if len(batch) <= 2] == [[0, 1], [2, 3], [4, 5], [6, 7]]
+    assert db.retry_stats['splits'] == 3
+    assert db.retry_stats['failures'] == 3
+    assert db.retry_stats['retries'] == 3
+
+def test_run_batch_single_row(db):
+    def locked(batch):
+        raise LOCKED
+
+    # 只有一行时不能再拆分
+    with pytest.raises(sqlite3.OperationalError):
+        db.run_batch(locked, [1], retries=0, delay=0)
+    assert db.retry_stats['splits'] == 0
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from equipsedit import models, fields, sql_db, shard
+
+class Acc(models.Model):
+    _name = 'test.acc'
+    _shard_key = 'account'
+
+    id = fields.BigInt(primary_key=True, index=True)
+    account = fields.Int(unique=True, null=False)
+    source = fields.Float('分数')
+
+@pytest.fixture
+def acc(monkeypatch):
+    router = shard.Router({'s1': sql_db.connect('sqlite:///:memory:'), 's2': sql_db.connect('sqlite:///:memory:')})
+    monkeypatch.setattr(models, 'Shards', router)
+    monkeypatch.setenv('EQUIPSEDIT_WORKER_ID', '1')
+    monkeypatch.setattr(shard, 'ids', None)
+    model = Acc()
+    model.create_table()
+    yield model
+    router.close()
+
+def _ids(model):
+    return {row['account']: row['id'] for row in model.search()}
+
+def test_upsert_distribution(acc):
+    acc.upsert_multi([{'account': i, 'source': i} for i in range(100)])
+
+    counts = [model.search().count() for model in acc.shards()]
+    assert sum(counts) == 100 and all(counts)
+    # 每条记录在ID所在的分片上
+    for name, model in zip(models.Shards.backends, acc.shards()):
+        assert all(models.Shards.for_id(row['id']) == name for row in model.search())
+    assert [row['account'] for row in acc.search(account=7)] == [7]
+
+def test_upsert_conflict_ids(acc, events):
+    acc.upsert_multi([{'account': i, 'source': 0} for i in range(10)], conflict_fields=('account',))
+    ids = _ids(acc)
+    del events[:]
+
+    # 冲突的行保留原有ID，变更事件中的ID均为实际存在的记录
+    ret = acc.upsert_multi([{'account': i, 'source': 1} for i in range(5, 15)], conflict_fields=('account',))
+    assert ret == {'inserted': 5, 'updated': 5}
+    after = _ids(acc)
+    assert all(after[i] == ids[i] for i in range(10))
+    published = {id for change in events for id in change.ids}
+    assert published == {after[i] for i in range(5, 15)}
+
+def test_import_file(acc, tmp_path, events):
+    path = tmp_path / 'acc.csv'
+    path.write_text('account,source\n' + ''.join(f'{i},{i}\n' for i in range(50)))
+
+    ret = acc.import_file(str(path), chunk_size=20, progress=lambda rows, seconds: None)
+    assert (ret['rows'], ret['skipped']) == (50, 0)
+    ids = _ids(acc)
+    assert sorted(ids) == list(range(50))
+    for name, model in zip(models.Shards.backends, acc.shards()):
+        assert all(models.Shards.for_id(row['id']) == name for row in model.search())
+    assert {id for change in events for id in change.ids} == set(ids.values())
+
+def test_import_file_on_shard(acc, tmp_path):
+    # 绑定分片的模型同样按ID写入所在的分片
+    path = tmp_path / 'acc.jsonl'
+    path.write_text(''.join(f'{{"account": {i}, "source": 1.5}}\n' for i in range(30)))
+
+    ret = acc.on_shard('s1').import_file(str(path), format='jsonl', progress=lambda rows, seconds: None)
+    assert ret['rows'] == 30
+    assert sorted(_ids(acc)) == list(range(30))
+    assert all(count for count in (model.search().count() for model in acc.shards()))
+
+def test_changes_since(acc):
+    acc.upsert_multi([{'account': i, 'source': i} for i in range(20)])
+    start = datetime.now() - timedelta(seconds=1)
+
+    rows = acc.changes_since(start)
+    assert sorted(row['account'] for row in rows) == list(range(20))
+    assert [(row['write_time'], row['id']) for row in rows] == sorted((row['write_time'], row['id']) for row in rows)
+    assert len(acc.changes_since(start, limit=5)) == 5
+    assert acc.changes_since(datetime.now() + timedelta(seconds=1)) == []
@@ -0,0 +1,72 @@
+import os
+from datetime import date
+
+import pytest
+
+from equipsedit import models, fields, snapshot
+from equipsedit.snapshot import Snapshot
+
+class Equip(models.Model):
+    _name = 'test.equip'
+
+    name = fields.Char('名称')
+    level = fields.Int('等级')
+    day = fields.Date('日期')
+    state = fields.Selection([('draft', '草稿'), ('done', '完成')], default='draft')
+
+def test_snapshot(tmp_path):
+    model = Equip()
+    model.create_table()
+    model.upsert_multi([{'name': f'装备{i}', 'level': i, 'day': date(2024, 1, i + 1)} for i in range(10)])
+    model.create({'name': None, 'level': None})
+    path = str(tmp_path / 'equip.snap')
+
+    assert model.snapshot(path)['rows'] == 11
+    with Snapshot(path) as snap:
+        assert len(snap) == 11
+        record = snap.get(3)
+        assert (record['name'], record['level'], record['day'], record['state']) == ('装备2', 2, date(2024, 1, 3), 'draft')
+        assert snap.get(11)['name'] is None
+        assert snap.get(100) is None
+        assert [row[0] for row in snap.tuples(['name'])][:2] == ['装备0', '装备1']
+
+def test_snapshot_incremental(tmp_path):
+    model = Equip()
+    model.create_table()
+    model.upsert_multi([{'name': f'装备{i}', 'level': i} for i in range(5)])
+    path = str(tmp_path / 'equip.snap')
+    model.snapshot(path)
+
+    model.update(2, {'name': '改名', 'state': 'done'})
+    model.delete(5)
+    ret = model.snapshot(path)
+    assert (ret['rows'], ret['deleted']) == (4, 1)
+    with Snapshot(path) as snap:
+        assert (snap.get(2)['name'], snap.get(2)['state']) == ('改名', 'done')
+        assert snap.get(5) is None
+
+def test_replace_retry(tmp_path, monkeypatch):
+    path = str(tmp_path / 'equip.snap')
+    tmp = str(tmp_path / 'equip.snap.tmp')
+    calls = []
+    replace = os.replace
+
+    def locked(src, dst):
+        # 模拟Windows上读取方仍映射着快照文件
+        calls.append(src)
+        if len(calls) < 3:
+            raise PermissionError(dst)
+        replace(src, dst)
+
+    monkeypatch.setattr(os, 'name', 'nt')
+    monkeypatch.setattr(os, 'replace', locked)
+    open(tmp, 'wb').close()
+    snapshot._replace(tmp, path, delay=0)
+    assert len(calls) == 3 and os.path.exists(path)
+
+    # 重试后仍被占用时删除临时文件并报错
+    calls.clear()
+    open(tmp, 'wb').close()
+    with pytest.raises(PermissionError):
+        snapshot._replace(tmp, path, retries=1, delay=0)
+    assert not os.path.exists(tmp)
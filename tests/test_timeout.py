@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from equipsedit import models, fields, transfer
+from equipsedit.errors import QueryTimeout
+
+# 执行约数秒的查询
+SLOW = 'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x+1 FROM c WHERE x<100000000) SELECT x FROM c'
+
+class Log(models.Model):
+    _name = 'test.timeout_log'
+
+    amount = fields.Int('数量')
+
+def test_execute_timeout(db):
+    start = time.monotonic()
+    with pytest.raises(QueryTimeout):
+        db.execute(f'SELECT COUNT(*) FROM ({SLOW})', timeout=0.05)
+    # 到期时中断语句，不等语句执行完
+    assert time.monotonic() - start < 1
+    assert sum(db.timeout_stats.values()) == 1
+
+    # 取消后连接仍可使用
+    db.execute('SELECT 1 AS x')
+    assert db.cursor.fetchone()['x'] == 1
+
+def test_deadline(db):
+    with db.deadline(0.05):
+        with pytest.raises(QueryTimeout):
+            db.execute(f'SELECT COUNT(*) FROM ({SLOW})')
+        time.sleep(0.06)
+        # 截止时间已过，不再执行
+        with pytest.raises(QueryTimeout):
+            db.execute('SELECT 1')
+    db.execute('SELECT 1')
+
+def test_stream_timeout(db):
+    # 超时包括调用方处理各批数据的时间
+    start = time.monotonic()
+    with pytest.raises(QueryTimeout):
+        for _ in db.stream(SLOW, size=100, timeout=0.1):
+            time.sleep(0.01)
+    assert time.monotonic() - start < 1
+
+    with pytest.raises(QueryTimeout):
+        with db.deadline(0.1):
+            for _ in db.stream(SLOW, size=100):
+                pass
+    assert [row for batch in db.stream('SELECT 1', timeout=1) for row in batch] == [(1,)]
+
+def test_query_timeout(db, tmp_path):
+    model = Log()
+    model.create_table()
+    model.create({'amount': 1})
+
+    with pytest.raises(QueryTimeout):
+        model.search().timeout(0).to_columns()
+    with pytest.raises(QueryTimeout):
+        transfer.export_file(model.search().timeout(0), db, str(tmp_path / 'log.csv'),
+                             progress=lambda rows, seconds: None)
+    with db.deadline(10):
+        assert len(model.search().timeout(5).to_columns()['amount']) == 1